@@ -1,5 +1,7 @@
 import math
-from os import urandom
+import os
+import zipfile
+from array import array
 from numba import njit
 import numpy as np
 
@@ -56,33 +58,138 @@ _capture_edges = {0: [(1, 2), (5, 10), (6, 12)], 1: [(2, 3), (6, 11)], 2: [(1, 0
                   22: [(16, 10), (17, 12), (18, 14), (21, 20), (23, 24)], 23: [(18, 13), (22, 21)], 24: [(18, 12), (19, 14), (23, 22)]}
 
 
-MOVE_MASKS = [0] * 25
-for src, dsts in _graph.items():
-    for dst in dsts:
-        MOVE_MASKS[src] |= (1 << dst)
+# The zobrist keys are drawn from a fixed, seeded generator (splitmix64) instead of os.urandom,
+# so state.key is the same across processes, runs and machines. This lets position keyed data
+# (TT entries, MCTS evaluations, analysis results) be shared between worker processes or saved to disk.
+# BAGCHAL_ZOBRIST_SEED overrides the seed. Bump ZOBRIST_VERSION whenever the key schedule changes,
+# so that anything persisted with the old keys can be told apart.
+ZOBRIST_VERSION = 1
+ZOBRIST_DEFAULT_SEED = 0x5EED_BA6C_4A1
+ZOBRIST_SEED = int(os.environ.get("BAGCHAL_ZOBRIST_SEED", str(ZOBRIST_DEFAULT_SEED)), 0)
+
+_MASK_64 = (1 << 64) - 1
+
+
+class _SplitMix64:
+    def __init__(self, seed):
+        self.state = seed & _MASK_64
+
+    def next(self):
+        self.state = (self.state + 0x9E3779B97F4A7C15) & _MASK_64
+        z = self.state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK_64
+        return z ^ (z >> 31)
+
+
+def random_u64(rng: _SplitMix64):
+    # keys are kept positive so they fit in an int64
+    return np.int64(rng.next() & ((1 << 63)-1))
+
+
+# Precomputed tables
+# The move/ capture masks and the zobrist keys are built once and saved to TABLES_FILE.
+# Later imports (every GUI launch, every multiprocessing worker) just load them.
+# The file is rebuilt whenever TABLES_VERSION, ZOBRIST_VERSION or ZOBRIST_SEED don't match.
+TABLES_VERSION = 1
+TABLES_FILE = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "bagchal_tables.npz")
+
+
+def _build_tables():
+    move_masks = np.zeros(25, dtype=np.int64)
+    for src, dsts in _graph.items():
+        mask = 0
+        for dst in dsts:
+            mask |= (1 << dst)
+        move_masks[src] = mask
+
+    max_captures = max(len(edges) for edges in _capture_edges.values())
+    capture_masks = np.zeros((25, max_captures, 2), dtype=np.int64)
+    capture_counts = np.zeros(25, dtype=np.int64)
+    for src, edges in _capture_edges.items():
+        capture_counts[src] = len(edges)
+        for j, (mid, land) in enumerate(edges):
+            capture_masks[src, j, 0] = 1 << mid  # mid mask for the src
+            capture_masks[src, j, 1] = 1 << land  # land mask for the src
+
+    # the key schedule: every key is drawn in this exact order
+    rng = _SplitMix64(ZOBRIST_SEED ^ (ZOBRIST_VERSION << 56))
+    # uniq random numbers for 2 types of pieces and 25 positions they can occupy
+    zobrist_piece = np.zeros((2, 25), dtype=np.int64)
+    for piece in range(2):
+        for pos in range(25):
+            zobrist_piece[piece, pos] = random_u64(rng)
+
+    # random number for side to move
+    zobrist_side = np.array([random_u64(rng)], dtype=np.int64)
+    # goats_to_place = 0 to 20
+    # this is relevant because, we're gonna be using transposition table
+    # to store the best move for the bound as well and moves are different
+    # for goats during placement_phase and movement_phase
+    zobrist_to_place = np.array([random_u64(rng)for _ in range(21)], dtype=np.int64)
+    zobrist_eaten = np.array([random_u64(rng) for _ in range(6)], dtype=np.int64)
+
+    return {
+        "meta": _tables_meta(),
+        "move_masks": move_masks,
+        "capture_masks": capture_masks,
+        "capture_counts": capture_counts,
+        "zobrist_piece": zobrist_piece,
+        "zobrist_side": zobrist_side,
+        "zobrist_to_place": zobrist_to_place,
+        "zobrist_eaten": zobrist_eaten,
+    }
+
+
+def _tables_meta():
+    # uint64: all 64 bits of the seed (the bits _SplitMix64 uses)
+    return np.array([TABLES_VERSION, ZOBRIST_VERSION, ZOBRIST_SEED & _MASK_64], dtype=np.uint64)
+
+
+def _load_tables():
+    meta = _tables_meta()
+    try:
+        with np.load(TABLES_FILE) as data:
+            if data["meta"].dtype == meta.dtype and np.array_equal(data["meta"], meta):
+                return {name: data[name] for name in data.files}
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+        # missing, truncated or otherwise unreadable (e.g. a write cut short): build it again
+        pass
 
-CAPTURE_MASKS = [[] for _ in range(25)]
-for src, edges in _capture_edges.items():
-    for mid, land in edges:
-        CAPTURE_MASKS[src].append((1 << mid, 1 << land))
+    tables = _build_tables()
+    try:
+        # write to a temporary file first, worker processes may be loading it at the same time
+        tmp_file = f"{TABLES_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, **tables)
+        os.replace(tmp_file, TABLES_FILE)
+    except OSError:
+        pass
+    return tables
 
 
+_tables = _load_tables()
+
 # numpy ones for numba
-MOVE_MASKS_NP = np.zeros(25, dtype=np.int64)
-for src, dsts in _graph.items():
-    mask = 0
-    for dst in dsts:
-        mask |= (1 << dst)
-    MOVE_MASKS_NP[src] = mask
-
-MAX_CAPTURES = max(len(edges) for edges in _capture_edges.values())
-CAPTURE_MASKS_NP = np.zeros((25, MAX_CAPTURES, 2), dtype=np.int64)
-CAPTURE_COUNTS = np.zeros(25, dtype=np.int64)
-for src, edges in _capture_edges.items():
-    CAPTURE_COUNTS[src] = len(edges)
-    for j, (mid, land) in enumerate(edges):
-        CAPTURE_MASKS_NP[src, j, 0] = 1 << mid  # mid mask for the src
-        CAPTURE_MASKS_NP[src, j, 1] = 1 << land  # land mask for the src
+MOVE_MASKS_NP = _tables["move_masks"]
+CAPTURE_MASKS_NP = _tables["capture_masks"]
+CAPTURE_COUNTS = _tables["capture_counts"]
+MAX_CAPTURES = CAPTURE_MASKS_NP.shape[1]
+
+ZOBRIST_PIECE = _tables["zobrist_piece"]
+ZOBRIST_SIDE = _tables["zobrist_side"][0]
+ZOBRIST_TO_PLACE = _tables["zobrist_to_place"]
+ZOBRIST_EATEN = _tables["zobrist_eaten"]
+
+MOVE_MASKS = MOVE_MASKS_NP.tolist()
+CAPTURE_MASKS = [[(mid, land) for mid, land in CAPTURE_MASKS_NP[src, :CAPTURE_COUNTS[src]].tolist()]
+                 for src in range(25)]
+
+# REACH_MASKS_NP[pos] -> every square whose content can change whether a tiger on pos is trapped or
+# has a potential capture: pos itself, its neighbours and the middle and landing squares of its captures
+REACH_MASKS_NP = np.array([(1 << pos) | MOVE_MASKS[pos] | np.bitwise_or.reduce(CAPTURE_MASKS_NP[pos].ravel())
+                           for pos in range(25)], dtype=np.int64)
 
 _outer_eddge = (0, 1, 2, 3, 4, 5, 10, 15, 20, 21, 22, 23, 24, 9, 14, 19)
 OUTER_EDGE_MASK = np.int64(0)
@@ -95,28 +202,84 @@ for pos in _strategic_positions:
     STRATEGIC_MASK |= (1 << pos)
 
 
-def random_u64():
-    return np.int64(int.from_bytes(urandom(8)) & ((1 << 63)-1))
-
+# the numpy keys above are for the njit code.
+# XORing a python int with a numpy scalar gives back a numpy scalar, so
+# make_move/ unmake_move use these plain python int copies of the same keys
+# to keep zob_hash a native int in the interpreted path.
+ZOBRIST_PIECE_INT = ZOBRIST_PIECE.tolist()
+ZOBRIST_SIDE_INT = int(ZOBRIST_SIDE)
+ZOBRIST_TO_PLACE_INT = ZOBRIST_TO_PLACE.tolist()
+ZOBRIST_EATEN_INT = ZOBRIST_EATEN.tolist()
+
+
+# Packed moves
+# a move is the int src * 25 + dst, with MOVE_CAPTURE_FLAG set for captures (placements have src == dst).
+# it fits in 11 bits, so the tables below are indexed directly by the packed move.
+# ints are cheaper than (src, dst) tuples to create, compare and hash, which is what the
+# search loops do with moves all the time. The agents still hand tuples to the GUI.
+MOVE_CAPTURE_FLAG = 1 << 10
+NUM_PACKED_MOVES = MOVE_CAPTURE_FLAG << 1
+MOVE_PLACEMENT, MOVE_STEP, MOVE_CAPTURE = 0, 1, 2
+
+
+def _build_move_tables():
+    # (src * 25 + dst) -> packed move
+    packed = []
+    for src in range(25):
+        landings = [land for _, land in _capture_edges[src]]
+        for dst in range(25):
+            packed.append(src * 25 + dst | (MOVE_CAPTURE_FLAG if dst in landings else 0))
+
+    # packed move -> src, dst, type, captured position (-1 for non captures), dst mask, (src, dst)
+    tables = ([], [], [], [], [], [])
+    for move in range(NUM_PACKED_MOVES):
+        src, dst = divmod(move & (MOVE_CAPTURE_FLAG - 1), 25)
+        src = min(src, 24)  # ids past 624 are never generated, they just get in range entries
+        is_capture = move & MOVE_CAPTURE_FLAG
+        move_type = MOVE_CAPTURE if is_capture else MOVE_PLACEMENT if src == dst else MOVE_STEP
+        captured = (src + dst) // 2 if is_capture else -1
+        for table, value in zip(tables, (src, dst, move_type, captured, 1 << dst, (src, dst))):
+            table.append(value)
+    return packed, tables
+
+
+PACKED_MOVE, (MOVE_SRC, MOVE_DST, MOVE_TYPE, MOVE_CAPTURED, MOVE_DST_MASK, MOVE_TUPLE) = _build_move_tables()
+
+MOVE_SRC_NP = np.array(MOVE_SRC, dtype=np.int64)
+MOVE_DST_NP = np.array(MOVE_DST, dtype=np.int64)
+MOVE_TYPE_NP = np.array(MOVE_TYPE, dtype=np.int64)
+MOVE_CAPTURED_NP = np.array(MOVE_CAPTURED, dtype=np.int64)
+MOVE_DST_MASK_NP = np.array(MOVE_DST_MASK, dtype=np.int64)
+
+
+# a packed move is an int, or a numpy integer when it comes straight out of a kernel's output buffer.
+# type() first: the plain int is by far the most common case, and the cheapest check
+def is_packed(move):
+    return type(move) is int or isinstance(move, np.integer)
+
+
+def pack_move(move):
+    """(src, dst) -> packed move. Packed moves are returned as python ints."""
+    if type(move) is int:
+        return move
+    if isinstance(move, np.integer):
+        return int(move)
+    src, dst = move
+    return PACKED_MOVE[src * 25 + dst]
 
-# uniq random numbers for 2 types of pieces and 25 positions they can occupy
-ZOBRIST_PIECE = np.zeros((2, 25), dtype=np.int64)
-for piece in range(2):
-    for pos in range(25):
-        ZOBRIST_PIECE[piece, pos] = random_u64()
 
-# random number for side to move
-ZOBRIST_SIDE = random_u64()
-# goats_to_place = 0 to 20
-# this is relevant because, we're gonna be using transposition table
-# to store the best move for the bound as well and moves are different
-# for goats during placement_phase and movement_phase
-ZOBRIST_TO_PLACE = np.array([random_u64()for _ in range(21)], dtype=np.int64)
-ZOBRIST_EATEN = np.array([random_u64() for _ in range(6)], dtype=np.int64)
+def unpack_move(move):
+    """packed move -> (src, dst). Tuples are returned as is."""
+    if type(move) is int or isinstance(move, np.integer):
+        return MOVE_TUPLE[move]
+    return move
 
 
-@njit
-def compute_zobrist(tigers_bb: int, goats_bb: int, side: int, goats_eaten: int, goats_to_place: int) -> int:
+@njit(cache=True)
+def compute_zobrist(tigers_bb: int, goats_bb: int, side: int, goats_eaten: int, goats_to_place: int,
+                    ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN) -> int:
+    # the keys are passed in rather than read as globals: numba bakes globals into the
+    # compiled code, which would then be cached on disk with the keys of the seed it was compiled with
     h = np.int64(0)
     while tigers_bb:
         lsb = tigers_bb & -tigers_bb
@@ -137,7 +300,7 @@ def compute_zobrist(tigers_bb: int, goats_bb: int, side: int, goats_eaten: int,
     return h
 
 
-@njit
+@njit(cache=True)
 def extract_indices_fast(bitboard: int):
     indices = []
     while bitboard:
@@ -148,7 +311,7 @@ def extract_indices_fast(bitboard: int):
     return indices
 
 
-@njit
+@njit(cache=True)
 def popcount(x: int) -> int:
     c = 0
     while x:
@@ -157,9 +320,185 @@ def popcount(x: int) -> int:
     return c
 
 
+# upper bound on the no of legal moves in any position
+# placement: at most 21 empty positions
+# movement: at most 6 empty positions (15+ goats, 4 tigers), each with at most 8 neighbours
+# tigers: 4 tigers, each with at most 8 steps and 8 jumps
+MAX_MOVES = 64
+
+@njit(cache=True)
+def count_trapped_tigers(tigers_bb: int, goats_bb: int, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS) -> int:
+    # a tiger is trapped when it can neither step nor jump
+    occupied_bb = tigers_bb | goats_bb
+    empty_bb = ~occupied_bb & BOARD_MASK
+    count = 0
+    fb = tigers_bb
+    while fb:
+        lsb = fb & -fb
+        tiger = math.frexp(lsb)[1] - 1
+        fb &= fb - 1
+        if MOVE_MASKS[tiger] & empty_bb:
+            continue
+        trapped = True
+        for j in range(CAPTURE_COUNTS[tiger]):
+            mid_mask = CAPTURE_MASKS[tiger, j, 0]
+            land_mask = CAPTURE_MASKS[tiger, j, 1]
+            if (goats_bb & mid_mask) and (empty_bb & land_mask):
+                trapped = False
+                break
+        if trapped:
+            count += 1
+    return count
+
+
+@njit(cache=True)
+def tiger_terms(tigers_bb: int, goats_bb: int, squares_bb: int, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS,
+                REACH_MASKS):
+    """
+    (potential captures, trapped tigers) counted over the tigers whose REACH_MASKS intersect squares_bb
+    (BOARD_MASK: all of them). A potential capture is a goat next to a tiger with an empty landing square.
+    """
+    occupied_bb = tigers_bb | goats_bb
+    empty_bb = ~occupied_bb & BOARD_MASK
+    potential_captures = 0
+    trapped = 0
+    fb = tigers_bb
+    while fb:
+        lsb = fb & -fb
+        tiger = math.frexp(lsb)[1] - 1
+        fb &= fb - 1
+        if not REACH_MASKS[tiger] & squares_bb:
+            continue
+        can_capture = False
+        for j in range(CAPTURE_COUNTS[tiger]):
+            if (goats_bb & CAPTURE_MASKS[tiger, j, 0]) and (empty_bb & CAPTURE_MASKS[tiger, j, 1]):
+                potential_captures += 1
+                can_capture = True
+        if not can_capture and not MOVE_MASKS[tiger] & empty_bb:
+            trapped += 1
+    return potential_captures, trapped
+
+
+@njit(cache=True)
+def update_tiger_terms(tigers_bb: int, goats_bb: int, new_tigers_bb: int, new_goats_bb: int,
+                       potential_captures: int, trapped: int, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS, REACH_MASKS):
+    """
+    The tiger_terms of the position after a move, from those before it: only the tigers within
+    reach of a changed square are counted again.
+    """
+    changed_bb = (tigers_bb ^ new_tigers_bb) | (goats_bb ^ new_goats_bb)
+    old_captures, old_trapped = tiger_terms(tigers_bb, goats_bb, changed_bb,
+                                            MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS, REACH_MASKS)
+    new_captures, new_trapped = tiger_terms(new_tigers_bb, new_goats_bb, changed_bb,
+                                            MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS, REACH_MASKS)
+    return potential_captures - old_captures + new_captures, trapped - old_trapped + new_trapped
+
+
+# marks a cached result that has not been computed yet (None means the game is in play)
+_UNKNOWN = object()
+
+
+@njit(cache=True)
+def generate_moves(tigers_bb: int, goats_bb: int, turn: int, goats_to_place: int, only_captures: bool,
+                   moves_out, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS) -> int:
+    """
+    Writes every legal move of the position into moves_out (shape (MAX_MOVES, 2))
+    as [src, dst] rows and returns the no of moves written.
+    The order is the same as the one produced by BitboardGameState.get_legal_moves.
+    """
+    n = 0
+    occupied_bb = tigers_bb | goats_bb
+    empty_bb = ~occupied_bb & BOARD_MASK
+
+    if turn == Piece_GOAT:
+        if goats_to_place > 0:
+            # Placement
+            fb = empty_bb
+            while fb:
+                lsb = fb & -fb
+                dst = math.frexp(lsb)[1] - 1
+                moves_out[n, 0] = dst
+                moves_out[n, 1] = dst
+                n += 1
+                fb &= fb - 1
+        else:
+            # Movement
+            sb = goats_bb
+            while sb:
+                lsb = sb & -sb
+                src = math.frexp(lsb)[1] - 1
+                sb &= sb - 1
+                db = MOVE_MASKS[src] & empty_bb
+                while db:
+                    dlsb = db & -db
+                    moves_out[n, 0] = src
+                    moves_out[n, 1] = math.frexp(dlsb)[1] - 1
+                    n += 1
+                    db &= db - 1
+        return n
+
+    sb = tigers_bb
+    while sb:
+        lsb = sb & -sb
+        src = math.frexp(lsb)[1] - 1
+        sb &= sb - 1
+
+        # captures first
+        for j in range(CAPTURE_COUNTS[src]):
+            mid_mask = CAPTURE_MASKS[src, j, 0]
+            land_mask = CAPTURE_MASKS[src, j, 1]
+            if (goats_bb & mid_mask) and (empty_bb & land_mask):
+                moves_out[n, 0] = src
+                moves_out[n, 1] = math.frexp(land_mask)[1] - 1
+                n += 1
+
+        if not only_captures:
+            db = MOVE_MASKS[src] & empty_bb
+            while db:
+                dlsb = db & -db
+                moves_out[n, 0] = src
+                moves_out[n, 1] = math.frexp(dlsb)[1] - 1
+                n += 1
+                db &= db - 1
+    return n
+
+
+@njit(cache=True)
+def generate_packed_moves(tigers_bb: int, goats_bb: int, turn: int, goats_to_place: int, only_captures: bool,
+                          moves_buf, packed_out, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS) -> int:
+    """
+    Like generate_moves, but also writes the moves packed into packed_out (shape (MAX_MOVES,)).
+    moves_buf is the (MAX_MOVES, 2) scratch buffer generate_moves writes into.
+    """
+    n = generate_moves(tigers_bb, goats_bb, turn, goats_to_place, only_captures,
+                       moves_buf, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS)
+    for i in range(n):
+        src = moves_buf[i, 0]
+        dst = moves_buf[i, 1]
+        move = src * 25 + dst
+        if src != dst and not MOVE_MASKS[src] & (1 << dst):
+            move |= MOVE_CAPTURE_FLAG
+        packed_out[i] = move
+    return n
+
+
+# Undo stack
+# one entry per move made: src, dst, captured position (-1 if none), zobrist hash before the move,
+# and in incremental mode the potential captures and trapped tigers before the move
+# stored flat in an int64 array so nothing is allocated per move, and compiled code can view it
+# with np.frombuffer(state._undo, dtype=np.int64).reshape(-1, UNDO_ENTRY_SIZE)
+# the array starts empty (copy() allocates nothing) and grows by UNDO_CAPACITY entries whenever
+# it is full, on the first make_move and then every UNDO_CAPACITY moves. It is not fixed-capacity
+UNDO_ENTRY_SIZE = 6
+UNDO_CAPACITY = 256  # moves
+_UNDO_BLOCK = array('q', bytes(8 * UNDO_ENTRY_SIZE * UNDO_CAPACITY))
+
+
 class BitboardGameState:
     __slots__ = ['tigers_bb', 'goats_bb', 'turn',
-                 'goats_to_place', 'goats_eaten', 'history', 'zob_hash']
+                 'goats_to_place', 'goats_eaten', 'history_len', 'zob_hash',
+                 '_undo', '_moves_buf', '_packed_buf', '_result', '_trapped',
+                 'incremental', '_potential_captures']
     piece = {
         -1: "🐐", 0: '  ', 1: "🐅"
     }
@@ -170,16 +509,32 @@ class BitboardGameState:
                  goats_bb=0,
                  turn=Piece_GOAT,
                  goats_to_place=20,
-                 goats_eaten=0):
+                 goats_eaten=0,
+                 incremental=False):
 
         self.tigers_bb = tigers_bb
         self.goats_bb = goats_bb
         self.turn = turn
         self.goats_to_place = goats_to_place
         self.goats_eaten = goats_eaten
-        self.history = []
+        self.history_len = 0
+        self._undo = array('q')
+        # move generation scratch buffers, allocated on first use (see _buffers)
+        self._moves_buf = None
+        self._packed_buf = None
+        # lazily computed terminal status of the current position
+        # reset by make_move/ unmake_move
+        self._result = _UNKNOWN
+        self._trapped = -1
+        self._potential_captures = -1
+        # incremental: keep the trapped tiger count and the potential captures (the cheap evaluation
+        # terms) up to date in make_move/ unmake_move instead of counting them when asked for
+        self.incremental = incremental
+        if incremental:
+            self._potential_captures, self._trapped = self._count_tiger_terms()
         self.zob_hash = compute_zobrist(
-            self.tigers_bb, self.goats_bb, self.turn, self.goats_eaten, self.goats_to_place)
+            self.tigers_bb, self.goats_bb, self.turn, self.goats_eaten, self.goats_to_place,
+            ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN)
 
     def __repr__(self) -> str:
         return f"Turn: {self.piece[self.turn]}, Goat Left: {self.goats_to_place}, Eaten Goat: {self.goats_eaten}, Trapped Tiger: {self.trapped_tiger_count}"
@@ -188,13 +543,26 @@ class BitboardGameState:
     def key(self):
         return self.zob_hash
 
+    @property
+    def history(self):
+        # [((src, dst), captured position or -1), ...] from the first move on
+        # built on every access, use history_len to just check for moves to undo
+        undo = self._undo
+        return [((undo[i], undo[i + 1]), undo[i + 2])
+                for i in range(0, self.history_len * UNDO_ENTRY_SIZE, UNDO_ENTRY_SIZE)]
+
     @property
     def get_result(self):
+        if self._result is _UNKNOWN:
+            self._result = self._compute_result()
+        return self._result
+
+    def _compute_result(self):
         if self.goats_eaten >= 5:
             return Piece_TIGER
         if self.trapped_tiger_count == 4:
             return Piece_GOAT
-        if not self.get_legal_moves():
+        if not self._generate_moves():
             return self.turn * -1
         return None
 
@@ -202,90 +570,77 @@ class BitboardGameState:
     def is_game_over(self):
         return self.get_result is not None
 
-    def _is_trapped(self, tiger, empty_bb):
-        if MOVE_MASKS[tiger] & empty_bb:
-            return False
-
-        # left if we decide to njit this method too
-        # for j in range(CAPTURE_COUNTS[tiger]):
-        #     mid_mask = CAPTURE_MASKS_NP[tiger, j, 0]
-        #     land_mask = CAPTURE_MASKS_NP[tiger, j, 1]
-        #     if (self.goats_bb & mid_mask) and (empty_bb & land_mask):
-        #         return False
-
-        for mid_mask, land_mask in CAPTURE_MASKS[tiger]:
-            if (self.goats_bb & mid_mask) and (empty_bb & land_mask):
-                return False
-
-        return True
-
     @property
     def trapped_tiger_count(self):
-        occupied_bb = self.tigers_bb | self.goats_bb
-        empty_bb = ~occupied_bb & BOARD_MASK
-        count = 0
-
-        for tiger in extract_indices_fast(self.tigers_bb):
-            if self._is_trapped(tiger, empty_bb):
-                count += 1
-        return count
-
-    def get_legal_moves(self, only_captures=False):
-        moves = []
-        occupied_bb = self.tigers_bb | self.goats_bb
-        empty_bb = ~occupied_bb & BOARD_MASK
-
-        if self.turn == Piece_GOAT:
-            if self.goats_to_place > 0:
-                # Placement
-                for dst in extract_indices_fast(empty_bb):
-                    moves.append((dst, dst))
-                return moves
-            else:
-                # Movement
-                for src in extract_indices_fast(self.goats_bb):
-                    moves.extend(self._get_standard_moves(src, empty_bb))
-                return moves
-
-        else:
-            for src in extract_indices_fast(self.tigers_bb):
-
-                moves.extend((self._get_capture_moves(src, empty_bb)))
-
-                if not only_captures:
-                    moves.extend(self._get_standard_moves(src, empty_bb))
-
-            return moves
+        if self._trapped < 0:
+            self._trapped = self._count_trapped_tigers()
+        return self._trapped
 
-    def _get_standard_moves(self, src, empty_bb):
-        moves = []
-        # adjacent to src and empty
-        possible_moves = MOVE_MASKS[src] & empty_bb
-        for dst in extract_indices_fast(possible_moves):
-            moves.append((src, dst))
-        return moves
+    def _count_trapped_tigers(self):
+        return count_trapped_tigers(self.tigers_bb, self.goats_bb, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
 
-    def _get_capture_moves(self, src, empty_bb):
-        # this move is only meant for tigers
-        moves = []
-        assert self.tigers_bb & (1 << src)
+    @property
+    def potential_captures(self):
+        # goats next to a tiger with an empty landing square behind them
+        if self._potential_captures < 0:
+            self._potential_captures = self._count_tiger_terms()[0]
+        return self._potential_captures
 
-        # for j in range(CAPTURE_COUNTS[src]):
-        #     mid_mask = CAPTURE_MASKS_NP[src, j, 0]
-        #     land_mask = CAPTURE_MASKS_NP[src, j, 1]
+    @property
+    def goats_on_board(self):
+        return 20 - self.goats_eaten - self.goats_to_place
 
-        for mid_mask, land_mask in CAPTURE_MASKS[src]:
-            if (self.goats_bb & mid_mask) and (empty_bb & land_mask):
-                dst = math.frexp(land_mask)[1] - 1
-                moves.append((src, dst))
+    def _count_tiger_terms(self):
+        return tiger_terms(self.tigers_bb, self.goats_bb, BOARD_MASK,
+                           MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP, REACH_MASKS_NP)
 
-        return moves
+    def get_legal_moves(self, only_captures=False):
+        n = self._generate_moves(only_captures)
+        return list(map(tuple, self._moves_buf[:n].tolist()))
+
+    def get_legal_moves_np(self, only_captures=False):
+        # (n, 2) array of [src, dst] rows
+        n = self._generate_moves(only_captures)
+        return self._moves_buf[:n].copy()
+
+    def get_packed_moves(self, only_captures=False):
+        # same moves in the same order as get_legal_moves, packed
+        moves_buf, packed_buf = self._buffers()
+        n = generate_packed_moves(self.tigers_bb, self.goats_bb, self.turn, self.goats_to_place, only_captures,
+                                  moves_buf, packed_buf, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
+        return packed_buf[:n].tolist()
+
+    def generate_packed_moves(self, packed_out, only_captures=False):
+        # get_packed_moves into the caller's (MAX_MOVES,) buffer, returns the no of moves
+        return generate_packed_moves(self.tigers_bb, self.goats_bb, self.turn, self.goats_to_place, only_captures,
+                                     self._buffers()[0], packed_out, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
+
+    def _generate_moves(self, only_captures=False):
+        return generate_moves(self.tigers_bb, self.goats_bb, self.turn, self.goats_to_place, only_captures,
+                              self._buffers()[0], MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
+
+    def _buffers(self):
+        # every state owns its buffers so that the GUI and the AI thread
+        # never write into the same one. Allocated on the first move generation,
+        # a copy that is only looked at (or only has moves made on it) never needs them
+        if self._moves_buf is None:
+            self._moves_buf = np.empty((MAX_MOVES, 2), dtype=np.int64)
+            self._packed_buf = np.empty(MAX_MOVES, dtype=np.int64)
+        return self._moves_buf, self._packed_buf
 
     def make_move(self, move):
-        src, dst = move
+        # move: (src, dst) or packed (see is_packed, inlined here)
+        if type(move) is int or isinstance(move, np.integer):
+            src = MOVE_SRC[move]
+            dst = MOVE_DST[move]
+        else:
+            src, dst = move
         captured_piece_position = -1
+        prev_hash = self.zob_hash
+        prev_tigers_bb = self.tigers_bb
+        prev_goats_bb = self.goats_bb
 
-        self.zob_hash ^= ZOBRIST_SIDE
+        self.zob_hash ^= ZOBRIST_SIDE_INT
 
         occupied_bb = (self.tigers_bb | self.goats_bb)
 
@@ -294,9 +649,9 @@ class BitboardGameState:
             assert not occupied_bb & (1 << dst)
 
             # update hash
-            self.zob_hash ^= ZOBRIST_TO_PLACE[self.goats_to_place]
-            self.zob_hash ^= ZOBRIST_TO_PLACE[self.goats_to_place-1]
-            self.zob_hash ^= ZOBRIST_PIECE[1, dst]
+            self.zob_hash ^= ZOBRIST_TO_PLACE_INT[self.goats_to_place]
+            self.zob_hash ^= ZOBRIST_TO_PLACE_INT[self.goats_to_place-1]
+            self.zob_hash ^= ZOBRIST_PIECE_INT[1][dst]
 
             # make move
             self.goats_bb |= (1 << dst)
@@ -312,15 +667,15 @@ class BitboardGameState:
             if self.turn == Piece_TIGER:
                 assert self.tigers_bb & (1 << src)
                 # update hash
-                self.zob_hash ^= ZOBRIST_PIECE[0, src]
-                self.zob_hash ^= ZOBRIST_PIECE[0, dst]
+                self.zob_hash ^= ZOBRIST_PIECE_INT[0][src]
+                self.zob_hash ^= ZOBRIST_PIECE_INT[0][dst]
 
                 # make move
                 self.tigers_bb ^= move_mask
             elif self.turn == Piece_GOAT:
                 assert self.goats_bb & (1 << src)
-                self.zob_hash ^= ZOBRIST_PIECE[1, src]
-                self.zob_hash ^= ZOBRIST_PIECE[1, dst]
+                self.zob_hash ^= ZOBRIST_PIECE_INT[1][src]
+                self.zob_hash ^= ZOBRIST_PIECE_INT[1][dst]
 
                 self.goats_bb ^= move_mask
 
@@ -336,11 +691,11 @@ class BitboardGameState:
             move_mask = (1 << src) | (1 << dst)
 
             # update hash
-            self.zob_hash ^= ZOBRIST_PIECE[0, src]
-            self.zob_hash ^= ZOBRIST_PIECE[1, mid]
-            self.zob_hash ^= ZOBRIST_PIECE[0, dst]
-            self.zob_hash ^= ZOBRIST_EATEN[self.goats_eaten]
-            self.zob_hash ^= ZOBRIST_EATEN[self.goats_eaten+1]
+            self.zob_hash ^= ZOBRIST_PIECE_INT[0][src]
+            self.zob_hash ^= ZOBRIST_PIECE_INT[1][mid]
+            self.zob_hash ^= ZOBRIST_PIECE_INT[0][dst]
+            self.zob_hash ^= ZOBRIST_EATEN_INT[self.goats_eaten]
+            self.zob_hash ^= ZOBRIST_EATEN_INT[self.goats_eaten+1]
 
             # make move
             self.tigers_bb ^= move_mask
@@ -349,27 +704,53 @@ class BitboardGameState:
             self.goats_eaten += 1
             captured_piece_position = mid
 
-        self.history.append((move, captured_piece_position))
+        i = self.history_len * UNDO_ENTRY_SIZE
+        undo = self._undo
+        if i == len(undo):
+            undo.extend(_UNDO_BLOCK)
+        undo[i] = src
+        undo[i + 1] = dst
+        undo[i + 2] = captured_piece_position
+        undo[i + 3] = prev_hash
+        self.history_len += 1
+
         self.turn *= -1
+        self._result = _UNKNOWN
+        if self.incremental:
+            undo[i + 4] = self._potential_captures
+            undo[i + 5] = self._trapped
+            self._potential_captures, self._trapped = update_tiger_terms(
+                prev_tigers_bb, prev_goats_bb, self.tigers_bb, self.goats_bb,
+                self._potential_captures, self._trapped,
+                MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP, REACH_MASKS_NP)
+        else:
+            self._trapped = -1
+            self._potential_captures = -1
 
     def unmake_move(self):
-        if not self.history:
+        if not self.history_len:
             return
 
-        last_move, captured_piece_position = self.history.pop()
-
-        src, dst = last_move
+        self.history_len -= 1
+        i = self.history_len * UNDO_ENTRY_SIZE
+        undo = self._undo
+        src = undo[i]
+        dst = undo[i + 1]
+        captured_piece_position = undo[i + 2]
+        # the hash before the move was saved, no need to xor the keys back out
+        self.zob_hash = undo[i + 3]
 
-        self.zob_hash ^= ZOBRIST_SIDE
         self.turn *= -1
+        self._result = _UNKNOWN
+        if self.incremental:
+            self._potential_captures = undo[i + 4]
+            self._trapped = undo[i + 5]
+        else:
+            self._trapped = -1
+            self._potential_captures = -1
 
         if (self.turn == Piece_GOAT and src == dst
                 and captured_piece_position == -1 and self.goats_to_place < 20):
-            # update hash
-            self.zob_hash ^= ZOBRIST_TO_PLACE[self.goats_to_place]
-            self.zob_hash ^= ZOBRIST_TO_PLACE[self.goats_to_place+1]
-            self.zob_hash ^= ZOBRIST_PIECE[1, dst]
-
             # remove goat from dst
             self.goats_bb &= ~(1 << dst)
             self.goats_to_place += 1
@@ -377,13 +758,6 @@ class BitboardGameState:
         elif self.turn == Piece_TIGER and captured_piece_position != -1:
             mid = captured_piece_position
 
-            # update hash
-            self.zob_hash ^= ZOBRIST_PIECE[0, dst]
-            self.zob_hash ^= ZOBRIST_PIECE[1, mid]
-            self.zob_hash ^= ZOBRIST_PIECE[0, src]
-            self.zob_hash ^= ZOBRIST_EATEN[self.goats_eaten]
-            self.zob_hash ^= ZOBRIST_EATEN[self.goats_eaten-1]
-
             # move from dst to src
             self.tigers_bb ^= (1 << dst) | (1 << src)
             # replace goat at mid
@@ -392,37 +766,51 @@ class BitboardGameState:
         else:
             move_mask = (1 << dst) | (1 << src)
             if self.turn == Piece_TIGER:
-                # update hash
-                self.zob_hash ^= ZOBRIST_PIECE[0, dst]
-                self.zob_hash ^= ZOBRIST_PIECE[0, src]
-
                 # move from dst to src
                 self.tigers_bb ^= move_mask
             else:
-                # update hash
-                self.zob_hash ^= ZOBRIST_PIECE[1, dst]
-                self.zob_hash ^= ZOBRIST_PIECE[1, src]
-
                 # move from dst to src
                 self.goats_bb ^= move_mask
 
-    def copy(self):
-        tigers_bb = self.tigers_bb
-        goats_bb = self.goats_bb
-        turn = self.turn
-        goats_to_place = self.goats_to_place
-        goats_eaten = self.goats_eaten
-        copy_state = BitboardGameState(tigers_bb,
-                                       goats_bb,
-                                       turn,
-                                       goats_to_place,
-                                       goats_eaten)
+    def make_null_move(self):
+        # the side to move passes (null-move pruning). Not on the undo stack,
+        # undo with unmake_null_move before any unmake_move
+        self.zob_hash ^= ZOBRIST_SIDE_INT
+        self.turn *= -1
+        self._result = _UNKNOWN
+
+    def unmake_null_move(self):
+        self.zob_hash ^= ZOBRIST_SIDE_INT
+        self.turn *= -1
+        self._result = _UNKNOWN
+
+    def copy(self, incremental=None):
+        # incremental: None keeps the mode of this state
+        # field by field rather than through __init__: the hash and the cached terms of the
+        # position carry over, and nothing is allocated until the copy needs it
+        copy_state = BitboardGameState.__new__(BitboardGameState)
+        copy_state.tigers_bb = self.tigers_bb
+        copy_state.goats_bb = self.goats_bb
+        copy_state.turn = self.turn
+        copy_state.goats_to_place = self.goats_to_place
+        copy_state.goats_eaten = self.goats_eaten
+        copy_state.zob_hash = self.zob_hash
+        copy_state.history_len = 0
+        copy_state._undo = array('q')
+        copy_state._moves_buf = None
+        copy_state._packed_buf = None
+        copy_state._result = self._result
+        copy_state._trapped = self._trapped
+        copy_state._potential_captures = self._potential_captures
+        copy_state.incremental = self.incremental if incremental is None else incremental
+        if copy_state.incremental and (self._trapped < 0 or self._potential_captures < 0):
+            copy_state._potential_captures, copy_state._trapped = copy_state._count_tiger_terms()
         return copy_state
 
     def is_quiet(self, move):
         # for tiger an unquiet move is a capture move
         # for goat an unquiet move is one that walks into a guaranteed capture
-        src, dst = move
+        src, dst = unpack_move(move)
         is_placment = src == dst
         occupied_bb = self.tigers_bb | self.goats_bb
         empty_bb = ~occupied_bb & BOARD_MASK
@@ -432,28 +820,31 @@ class BitboardGameState:
         if self.turn == Piece_GOAT:
             # one case in placement:
             #  a tiger adjacent to the dst can capture the piece
+            # CAPTURE_MASKS holds (mid, land) bitboards, so compare against the masks of src/ dst
             neighboring_tigers = self.tigers_bb & MOVE_MASKS[dst]
+            src_mask = 1 << src
+            dst_mask = 1 << dst
             if is_placment:
                 for tiger in extract_indices_fast(neighboring_tigers):
                     for mid, land in CAPTURE_MASKS[tiger]:
-                        if mid == dst and (1 << land) & empty_bb:
+                        if mid == dst_mask and land & empty_bb:
                             return False
             # two cases in movement:
             else:
                 for tiger in extract_indices_fast(neighboring_tigers):
                     for mid, land in CAPTURE_MASKS[tiger]:
                         # 1) goat moves from landing to mid
-                        if src == land and mid == dst:
+                        if land == src_mask and mid == dst_mask:
                             return False
 
                         # 2) goat moves into mid and landing is empty
-                        if mid == dst and (1 << land) & empty_bb:
+                        if mid == dst_mask and land & empty_bb:
                             return False
                     # there's a third case in movement where a goat can unblock a capture but it's inefficient to calculate
             return True
 
 
-@njit
+@njit(cache=True)
 def tiger_board_accessibility(tigers_bb: int, goats_bb: int, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS):
 
     occupied_bb = tigers_bb | goats_bb
@@ -497,7 +888,7 @@ def tiger_board_accessibility(tigers_bb: int, goats_bb: int, MOVE_MASKS, CAPTURE
     return accessible_count, inaccessible_count
 
 
-@njit
+@njit(cache=True)
 def tiger_priority(tigers_bb: int, goats_bb: int, move, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS):
     priority_score = 0
     src, dst = move
@@ -538,7 +929,7 @@ def tiger_priority(tigers_bb: int, goats_bb: int, move, MOVE_MASKS, CAPTURE_COUN
     return priority_score
 
 
-@njit
+@njit(cache=True)
 def goat_priority(tigers_bb: int, goats_bb: int, move, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS, OUTER_EDGE_MASK, STRATEGIC_MASK):
     src, dst = move
     is_placement_phase = src == dst
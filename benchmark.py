@@ -0,0 +1,394 @@
+import contextlib
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from bagchal import *
+from negamax import AlphaBetaAgent, PVTable, TM_SOFT_RATIO
+from mcts import MCTS
+from positions import BENCHMARK_POSITIONS, make_position
+
+
+def bench_make_unmake(iterations=200_000):
+    """make_move/ unmake_move pairs per second over the legal moves of every benchmark position."""
+    for name in BENCHMARK_POSITIONS:
+        gs = make_position(name)
+        moves = gs.get_legal_moves()
+        n = 0
+        start = time.perf_counter()
+        while n < iterations:
+            for move in moves:
+                gs.make_move(move)
+                gs.unmake_move()
+            n += len(moves)
+        elapsed = time.perf_counter() - start
+        print(f"[make/unmake] {name:<16} {n / elapsed:>10.0f} pairs/s")
+
+
+def bench_mcts(time_limit=1.0):
+    """Simulations per second of MCTS on every benchmark position."""
+    mcts = MCTS()
+    total_sims = 0
+    total_time = 0.0
+    for name in BENCHMARK_POSITIONS:
+        gs = make_position(name)
+        start = time.perf_counter()
+        mcts.search(gs, time_limit=time_limit, game_history=[])
+        elapsed = time.perf_counter() - start
+        total_sims += mcts.simulations_run
+        total_time += elapsed
+        print(f"[mcts] {name:<16} {mcts.simulations_run / elapsed:>10.0f} sims/s")
+    print(f"[mcts] {'total':<16} {total_sims / total_time:>10.0f} sims/s")
+
+
+def bench_evaluate(plies=2000, seed=0):
+    """
+    make_move + AlphaBetaAgent.evaluate + unmake_move per second over random games from every
+    benchmark position, with the evaluation terms counted at the leaf and kept incrementally.
+    """
+    for incremental in (False, True):
+        agent = AlphaBetaAgent()
+        rng = random.Random(seed)
+        evaluations = 0
+        start = time.perf_counter()
+        for name in BENCHMARK_POSITIONS:
+            gs = make_position(name).copy(incremental=incremental)
+            agent.game_state = gs
+            for _ in range(plies):
+                moves = gs.get_packed_moves()
+                if gs.is_game_over or gs.history_len > 20:
+                    while gs.history_len:
+                        gs.unmake_move()
+                    continue
+                for move in moves:
+                    gs.make_move(move)
+                    agent.evaluate()
+                    gs.unmake_move()
+                evaluations += len(moves)
+                gs.make_move(rng.choice(moves))
+        elapsed = time.perf_counter() - start
+        label = "incremental" if incremental else "full"
+        print(f"[evaluate] {label:<12} {evaluations / elapsed:>10.0f} evaluations/s")
+
+
+class _ListLine(list):
+    # the PV collection PVTable replaced: a new line per node, the child's line copied in on every update
+    ...
+
+
+def bench_pv(iterations=200_000, depth=6):
+    """
+    ns per node for collecting the PV with PVTable and with a new list per node, from the cost of
+    starting a node's line, of an update, and the no of updates per node in a search to depth.
+    """
+    agent = AlphaBetaAgent()
+    updates = 0
+    update = agent.pv_table.update
+
+    def counted_update(ply, move):
+        nonlocal updates
+        updates += 1
+        update(ply, move)
+
+    agent.pv_table.update = counted_update
+    nodes = 0
+    for name in BENCHMARK_POSITIONS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.get_best_move(make_position(name), game_history=[], time_limit=float('inf'), max_depth=depth)
+        nodes += agent.no_of_nodes
+    updates_per_node = updates / nodes
+
+    table = PVTable()
+    for ply in range(depth, -1, -1):
+        table.init_node(ply)
+        if ply < depth:
+            table.update(ply, ply)
+    child_line = _ListLine(range(1, depth))
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        table.init_node(1)
+    init_table = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(iterations):
+        table.update(0, 0)
+    update_table = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        line = _ListLine()
+    init_list = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(iterations):
+        line.clear()
+        line.append(0)
+        line.extend(child_line)
+    update_list = time.perf_counter() - start
+
+    print(f"[pv] {updates_per_node:.4f} updates per node (depth {depth})")
+    for label, init, update in (("PVTable", init_table, update_table), ("list per node", init_list, update_list)):
+        per_node = (init + update * updates_per_node) / iterations * 1e9
+        print(f"[pv] {label:<14} init: {init / iterations * 1e9:>5.0f} ns  update: {update / iterations * 1e9:>5.0f} ns  "
+              f"per node: {per_node:>5.0f} ns")
+
+
+def bench_negamax(time_limit=1.0):
+    """Nodes per second of AlphaBetaAgent on every benchmark position."""
+    agent = AlphaBetaAgent()
+    total_nodes = 0
+    total_time = 0.0
+    for name in BENCHMARK_POSITIONS:
+        gs = make_position(name)
+        start = time.perf_counter()
+        agent.get_best_move(gs, time_limit=time_limit, game_history=[])
+        elapsed = time.perf_counter() - start
+        total_nodes += agent.no_of_nodes
+        total_time += elapsed
+        print(f"[negamax] {name:<16} {agent.no_of_nodes / elapsed:>10.0f} nodes/s")
+    print(f"[negamax] {'total':<16} {total_nodes / total_time:>10.0f} nodes/s")
+
+
+def bench_selfplay(depth=6, max_plies=60):
+    """
+    Time-to-depth over a self-play game, with the TT cleared before every move and with it
+    kept between moves. The game is played by the first agent, both search every position.
+    """
+    agents = {"cleared": AlphaBetaAgent(), "kept": AlphaBetaAgent(keep_tt=True)}
+    totals = dict.fromkeys(agents, 0.0)
+    gs = BitboardGameState()
+    game_history = set()
+    plies = 0
+    while not gs.is_game_over and plies < max_plies:
+        game_history.add(gs.key)
+        for label, agent in agents.items():
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                move = agent.get_best_move(gs, game_history=game_history, time_limit=float('inf'),
+                                           max_depth=depth)
+            totals[label] += time.perf_counter() - start
+            if label == "cleared":
+                game_move = move
+        gs.make_move(game_move)
+        plies += 1
+    for label, total in totals.items():
+        print(f"[selfplay] TT {label:<8} depth {depth}: {total / plies * 1000:>8.1f} ms/move "
+              f"over {plies} plies")
+
+
+def bench_eval_cache(depth=5, max_plies=30):
+    """
+    Time-to-depth and evaluation cache hit rate over a self-play game, without the cache and with it.
+    The TT is cleared before every move (the default), the cache is kept.
+    """
+    agents = {"off": AlphaBetaAgent(eval_cache_mb=0), "on": AlphaBetaAgent()}
+    totals = dict.fromkeys(agents, 0.0)
+    gs = BitboardGameState()
+    game_history = set()
+    plies = 0
+    while not gs.is_game_over and plies < max_plies:
+        game_history.add(gs.key)
+        for label, agent in agents.items():
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                move = agent.get_best_move(gs, game_history=game_history, time_limit=float('inf'),
+                                           max_depth=depth)
+            totals[label] += time.perf_counter() - start
+        gs.make_move(move)
+        plies += 1
+    for label, total in totals.items():
+        cache = agents[label].eval_cache
+        hit_rate = f"hit rate (last move) {cache.hit_rate():.1%}" if cache else ""
+        print(f"[eval cache] {label:<3} depth {depth}: {total / plies * 1000:>8.1f} ms/move "
+              f"over {plies} plies  {hit_rate}")
+
+
+def bench_lazy_smp(depth=7, workers=(1, 2, 4, 8, 16)):
+    """
+    Time-to-depth of LazySMPAgent over the benchmark positions for every no of workers,
+    and the speedup over a single worker. Worker startup isn't timed.
+    """
+    from parallel import LazySMPAgent
+
+    base_time = None
+    for n_workers in workers:
+        with LazySMPAgent(workers=n_workers) as agent:
+            with contextlib.redirect_stdout(io.StringIO()):
+                agent.get_best_move(BitboardGameState(), game_history=[], time_limit=float('inf'), max_depth=1)
+            total = 0.0
+            for name in BENCHMARK_POSITIONS:
+                agent.clear_tt()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    agent.get_best_move(make_position(name), game_history=[], time_limit=float('inf'),
+                                        max_depth=depth)
+                total += time.perf_counter() - start
+        base_time = base_time or total
+        print(f"[lazy smp] {n_workers:>2} workers depth {depth}: {total:>7.2f}s "
+              f"speedup {base_time / total:>5.2f}x")
+
+
+def bench_root_split(depth=7, workers=(1, 2, 4, 8, 16)):
+    """Time-to-depth of AlphaBetaAgent(root_workers=n) over the benchmark positions, and the speedup."""
+    base_time = None
+    for n_workers in workers:
+        # starts the pool
+        agent = AlphaBetaAgent(root_workers=n_workers)
+        total = 0.0
+        for name in BENCHMARK_POSITIONS:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                agent.get_best_move(make_position(name), game_history=[], time_limit=float('inf'),
+                                    max_depth=depth)
+            total += time.perf_counter() - start
+        agent.close()
+        base_time = base_time or total
+        print(f"[root split] {n_workers:>2} workers depth {depth}: {total:>7.2f}s "
+              f"speedup {base_time / total:>5.2f}x")
+
+
+def bench_selective(depth=6):
+    """
+    Nodes and time-to-depth over the benchmark positions with late move reductions,
+    null-move pruning and futility pruning switched on one at a time, and all together.
+    """
+    configs = {
+        "off": {},
+        "lmr": dict(use_lmr=True),
+        "null move": dict(use_null_move=True),
+        "futility": dict(use_futility=True),
+        "all": dict(use_lmr=True, use_null_move=True, use_futility=True),
+    }
+    for label, kwargs in configs.items():
+        agent = AlphaBetaAgent(**kwargs)
+        total_nodes = 0
+        total_prunes = 0
+        total_time = 0.0
+        for name in BENCHMARK_POSITIONS:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                move = agent.get_best_move(make_position(name), game_history=[], time_limit=float('inf'),
+                                           max_depth=depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += agent.no_of_nodes
+            total_prunes += agent.futility_prunes
+            total_time += elapsed
+            print(f"[selective] {label:<9} {name:<16} {agent.no_of_nodes:>9} nodes {elapsed:>7.2f}s  "
+                  f"best move: {move}")
+        print(f"[selective] {label:<9} {'total':<16} {total_nodes:>9} nodes {total_time:>7.2f}s "
+              f"to depth {depth}, {total_prunes} futility prunes")
+        if kwargs.get("use_futility"):
+            assert total_prunes, "futility pruning didn't prune a single move"
+
+
+def bench_time_management(time_limit=1.0):
+    """
+    Depth reached, time used and time spent past the last completed iteration on every benchmark
+    position, iterating until the hard limit (soft_time_ratio=None) and with the default TimeManager.
+    """
+    for label, ratio in (("hard only", None), ("default", TM_SOFT_RATIO)):
+        agent = AlphaBetaAgent(soft_time_ratio=ratio)
+        for name in BENCHMARK_POSITIONS:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                agent.get_best_move(make_position(name), game_history=[], time_limit=time_limit)
+            elapsed = time.perf_counter() - start
+            depth, completed = agent.depth_times[-1] if agent.depth_times else (0, 0.0)
+            print(f"[time] {label:<9} {name:<16} depth {depth:>2}  used {elapsed:>5.2f}s  "
+                  f"past the last iteration {max(elapsed - completed, 0.0):>5.2f}s  "
+                  f"({agent.time_manager.stop_reason or 'hard limit'})")
+
+
+def bench_multipv(depth=5, ks=(1, 3, 5)):
+    """
+    Nodes and time-to-depth of get_best_moves(k) over the benchmark positions, next to
+    get_best_move (a single PV) and to searching every root move on its own.
+    """
+    agent = AlphaBetaAgent()
+    for label in ("single pv", *(f"k={k}" for k in ks), "every move"):
+        total_nodes = 0
+        total_time = 0.0
+        for name in BENCHMARK_POSITIONS:
+            gs = make_position(name)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if label == "single pv":
+                    agent.get_best_move(gs, game_history=[], time_limit=float('inf'), max_depth=depth)
+                    total_nodes += agent.no_of_nodes
+                elif label == "every move":
+                    for move in gs.get_legal_moves():
+                        state = gs.copy()
+                        state.make_move(move)
+                        if not state.is_game_over:
+                            agent.get_best_move(state, game_history=[], time_limit=float('inf'),
+                                                max_depth=depth - 1)
+                            total_nodes += agent.no_of_nodes
+                else:
+                    agent.get_best_moves(gs, k=int(label[2:]), game_history=[], time_limit=float('inf'),
+                                         max_depth=depth)
+                    total_nodes += agent.no_of_nodes
+            total_time += time.perf_counter() - start
+        print(f"[multipv] {label:<10} depth {depth}: {total_nodes:>9} nodes {total_time:>7.2f}s")
+
+
+# run in a fresh interpreter by bench_startup
+_STARTUP_SCRIPT = """
+import contextlib, io, time
+start = time.perf_counter()
+from bagchal import BitboardGameState
+from negamax import AlphaBetaAgent
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    AlphaBetaAgent().get_best_move(BitboardGameState(), game_history=[], time_limit=0.01)
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def bench_startup(runs=3):
+    """
+    Import time and time-to-first-move of a new process, without and with the
+    on-disk numba cache and table file.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+        for run in range(runs):
+            # the first run starts from an empty cache and has to compile everything
+            label = "cold" if run == 0 else "cached"
+            output = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT], cwd=here, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            import_time, first_move_time = map(float, output.split())
+            print(f"[startup] {label:<7} import: {import_time * 1000:>8.1f} ms  "
+                  f"first move: {first_move_time * 1000:>8.1f} ms")
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "make_unmake": bench_make_unmake,
+    "mcts": bench_mcts,
+    "evaluate": bench_evaluate,
+    "pv": bench_pv,
+    "negamax": bench_negamax,
+    "selfplay": bench_selfplay,
+    "eval_cache": bench_eval_cache,
+    "selective": bench_selective,
+    "time": bench_time_management,
+    "multipv": bench_multipv,
+    "lazy_smp": bench_lazy_smp,
+    "root_split": bench_root_split,
+}
+
+
+if __name__ == "__main__":
+    # usage: python benchmark.py [name ...]
+    names = sys.argv[1:] or list(BENCHMARKS)
+    if any(name != "startup" for name in names):
+        # warm up the jit so compilation doesn't count towards the first benchmark
+        warmup = BitboardGameState()
+        AlphaBetaAgent().get_best_move(warmup, time_limit=0.1, game_history=[])
+        MCTS().search(warmup, time_limit=0.1, game_history=[])
+
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,369 @@
+import random
+import sys
+from numba import njit, int64, boolean
+from numba.experimental import jitclass
+import numpy as np
+from bagchal import *
+from positions import BENCHMARK_POSITIONS, make_position
+
+# A numba jitclass with the same interface as BitboardGameState:
+# make_move/ unmake_move (tuple or packed moves), make/ unmake_null_move, get_legal_moves, get_packed_moves,
+# get_result, is_game_over, is_quiet, key, trapped_tiger_count, potential_captures and goats_on_board
+# behave exactly like the python class (same move order, same zobrist hash).
+# Unlike BitboardGameState it can be passed into njit functions, so a whole search
+# (see perft_state below) can run without going back to the interpreter.
+#
+# from python every method call goes through the jitclass boxing, which is slower than
+# calling the python class, so this only pays off when the loop itself is compiled.
+# jitclasses can't be cached on disk, the class is compiled on first use in every process (~10s).
+# That's why the agents, whose search loops are python, keep using BitboardGameState: only perft
+# runs on this class so far.
+
+_spec = [
+    ('tigers_bb', int64),
+    ('goats_bb', int64),
+    ('turn', int64),
+    ('goats_to_place', int64),
+    ('goats_eaten', int64),
+    ('history_len', int64),
+    ('zob_hash', int64),
+    # the tiger terms are counted on demand, there is no incremental mode
+    ('incremental', boolean),
+    # same layout as BitboardGameState._undo: src, dst, captured position, hash before the move
+    # (the incremental evaluation columns are left unused)
+    ('undo', int64[:, :]),
+    ('moves_buf', int64[:, :]),
+    ('packed_buf', int64[:]),
+    ('MOVE_MASKS', int64[:]),
+    ('CAPTURE_COUNTS', int64[:]),
+    ('CAPTURE_MASKS', int64[:, :, :]),
+    ('REACH_MASKS', int64[:]),
+    ('ZOBRIST_PIECE', int64[:, :]),
+    ('ZOBRIST_SIDE', int64),
+    ('ZOBRIST_TO_PLACE', int64[:]),
+    ('ZOBRIST_EATEN', int64[:]),
+]
+
+
+@jitclass(_spec)
+class CompiledGameState:
+    def __init__(self, tigers_bb, goats_bb, turn, goats_to_place, goats_eaten,
+                 MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS, REACH_MASKS,
+                 ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN):
+        self.tigers_bb = tigers_bb
+        self.goats_bb = goats_bb
+        self.turn = turn
+        self.goats_to_place = goats_to_place
+        self.goats_eaten = goats_eaten
+        self.history_len = 0
+        self.incremental = False
+        self.undo = np.empty((UNDO_CAPACITY, UNDO_ENTRY_SIZE), dtype=np.int64)
+        self.moves_buf = np.empty((MAX_MOVES, 2), dtype=np.int64)
+        self.packed_buf = np.empty(MAX_MOVES, dtype=np.int64)
+        self.MOVE_MASKS = MOVE_MASKS
+        self.CAPTURE_COUNTS = CAPTURE_COUNTS
+        self.CAPTURE_MASKS = CAPTURE_MASKS
+        self.REACH_MASKS = REACH_MASKS
+        self.ZOBRIST_PIECE = ZOBRIST_PIECE
+        self.ZOBRIST_SIDE = ZOBRIST_SIDE
+        self.ZOBRIST_TO_PLACE = ZOBRIST_TO_PLACE
+        self.ZOBRIST_EATEN = ZOBRIST_EATEN
+        self.zob_hash = compute_zobrist(tigers_bb, goats_bb, turn, goats_eaten, goats_to_place,
+                                        ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN)
+
+    @property
+    def key(self):
+        return self.zob_hash
+
+    @property
+    def get_result(self):
+        if self.goats_eaten >= 5:
+            return Piece_TIGER
+        if self.trapped_tiger_count == 4:
+            return Piece_GOAT
+        if self.generate_moves(False, self.moves_buf) == 0:
+            return self.turn * -1
+        return None
+
+    @property
+    def is_game_over(self):
+        return self.get_result is not None
+
+    @property
+    def trapped_tiger_count(self):
+        return count_trapped_tigers(self.tigers_bb, self.goats_bb,
+                                    self.MOVE_MASKS, self.CAPTURE_COUNTS, self.CAPTURE_MASKS)
+
+    @property
+    def potential_captures(self):
+        # goats next to a tiger with an empty landing square behind them
+        return tiger_terms(self.tigers_bb, self.goats_bb, BOARD_MASK, self.MOVE_MASKS,
+                           self.CAPTURE_COUNTS, self.CAPTURE_MASKS, self.REACH_MASKS)[0]
+
+    @property
+    def goats_on_board(self):
+        return 20 - self.goats_eaten - self.goats_to_place
+
+    def generate_moves(self, only_captures, moves_out):
+        # compiled callers pass one buffer per ply, moves_out is (MAX_MOVES, 2)
+        return generate_moves(self.tigers_bb, self.goats_bb, self.turn, self.goats_to_place, only_captures,
+                              moves_out, self.MOVE_MASKS, self.CAPTURE_COUNTS, self.CAPTURE_MASKS)
+
+    def get_legal_moves(self, only_captures=False):
+        n = self.generate_moves(only_captures, self.moves_buf)
+        moves = []
+        for i in range(n):
+            moves.append((self.moves_buf[i, 0], self.moves_buf[i, 1]))
+        return moves
+
+    def get_legal_moves_np(self, only_captures=False):
+        n = self.generate_moves(only_captures, self.moves_buf)
+        return self.moves_buf[:n].copy()
+
+    def generate_packed_moves(self, packed_out, only_captures=False):
+        # packed moves into the caller's (MAX_MOVES,) buffer, returns the no of moves
+        return generate_packed_moves(self.tigers_bb, self.goats_bb, self.turn, self.goats_to_place, only_captures,
+                                     self.moves_buf, packed_out, self.MOVE_MASKS, self.CAPTURE_COUNTS,
+                                     self.CAPTURE_MASKS)
+
+    def get_packed_moves(self, only_captures=False):
+        # same moves in the same order as get_legal_moves, packed
+        n = self.generate_packed_moves(self.packed_buf, only_captures)
+        moves = []
+        for i in range(n):
+            moves.append(self.packed_buf[i])
+        return moves
+
+    def is_quiet(self, move):
+        # same rules as BitboardGameState.is_quiet
+        if isinstance(move, int):
+            src = (move & (MOVE_CAPTURE_FLAG - 1)) // 25
+            dst = (move & (MOVE_CAPTURE_FLAG - 1)) % 25
+        else:
+            src, dst = move
+        if self.turn == Piece_TIGER:
+            return self.MOVE_MASKS[src] & (1 << dst) != 0
+        empty_bb = ~(self.tigers_bb | self.goats_bb) & BOARD_MASK
+        src_mask = 1 << src
+        dst_mask = 1 << dst
+        neighboring_tigers = self.tigers_bb & self.MOVE_MASKS[dst]
+        while neighboring_tigers:
+            lsb = neighboring_tigers & -neighboring_tigers
+            neighboring_tigers ^= lsb
+            tiger = popcount(lsb - 1)
+            for i in range(self.CAPTURE_COUNTS[tiger]):
+                mid = self.CAPTURE_MASKS[tiger, i, 0]
+                land = self.CAPTURE_MASKS[tiger, i, 1]
+                if mid == dst_mask and land & empty_bb:
+                    return False
+                if src != dst and land == src_mask and mid == dst_mask:
+                    return False
+        return True
+
+    def make_move(self, move):
+        # move: (src, dst) or packed
+        if isinstance(move, int):
+            src = (move & (MOVE_CAPTURE_FLAG - 1)) // 25
+            dst = (move & (MOVE_CAPTURE_FLAG - 1)) % 25
+        else:
+            src, dst = move
+        captured_piece_position = -1
+        prev_hash = self.zob_hash
+
+        self.zob_hash ^= self.ZOBRIST_SIDE
+
+        if self.turn == Piece_GOAT and self.goats_to_place > 0:
+            # Placement
+            self.zob_hash ^= self.ZOBRIST_TO_PLACE[self.goats_to_place]
+            self.zob_hash ^= self.ZOBRIST_TO_PLACE[self.goats_to_place - 1]
+            self.zob_hash ^= self.ZOBRIST_PIECE[1, dst]
+            self.goats_bb |= (1 << dst)
+            self.goats_to_place -= 1
+
+        elif self.MOVE_MASKS[src] & (1 << dst):
+            # Movement
+            move_mask = (1 << src) | (1 << dst)
+            if self.turn == Piece_TIGER:
+                self.zob_hash ^= self.ZOBRIST_PIECE[0, src]
+                self.zob_hash ^= self.ZOBRIST_PIECE[0, dst]
+                self.tigers_bb ^= move_mask
+            else:
+                self.zob_hash ^= self.ZOBRIST_PIECE[1, src]
+                self.zob_hash ^= self.ZOBRIST_PIECE[1, dst]
+                self.goats_bb ^= move_mask
+
+        else:
+            # Capture
+            mid = (src + dst) // 2
+            self.zob_hash ^= self.ZOBRIST_PIECE[0, src]
+            self.zob_hash ^= self.ZOBRIST_PIECE[1, mid]
+            self.zob_hash ^= self.ZOBRIST_PIECE[0, dst]
+            self.zob_hash ^= self.ZOBRIST_EATEN[self.goats_eaten]
+            self.zob_hash ^= self.ZOBRIST_EATEN[self.goats_eaten + 1]
+            self.tigers_bb ^= (1 << src) | (1 << dst)
+            self.goats_bb &= ~(1 << mid)
+            self.goats_eaten += 1
+            captured_piece_position = mid
+
+        if self.history_len == self.undo.shape[0]:
+            grown = np.empty((self.undo.shape[0] + UNDO_CAPACITY, UNDO_ENTRY_SIZE), dtype=np.int64)
+            grown[:self.history_len] = self.undo
+            self.undo = grown
+        entry = self.undo[self.history_len]
+        entry[0] = src
+        entry[1] = dst
+        entry[2] = captured_piece_position
+        entry[3] = prev_hash
+        self.history_len += 1
+
+        self.turn *= -1
+
+    def unmake_move(self):
+        if self.history_len == 0:
+            return
+
+        self.history_len -= 1
+        entry = self.undo[self.history_len]
+        src = entry[0]
+        dst = entry[1]
+        captured_piece_position = entry[2]
+        self.zob_hash = entry[3]
+
+        self.turn *= -1
+
+        if (self.turn == Piece_GOAT and src == dst
+                and captured_piece_position == -1 and self.goats_to_place < 20):
+            self.goats_bb &= ~(1 << dst)
+            self.goats_to_place += 1
+        elif self.turn == Piece_TIGER and captured_piece_position != -1:
+            self.tigers_bb ^= (1 << dst) | (1 << src)
+            self.goats_bb |= (1 << captured_piece_position)
+            self.goats_eaten -= 1
+        elif self.turn == Piece_TIGER:
+            self.tigers_bb ^= (1 << dst) | (1 << src)
+        else:
+            self.goats_bb ^= (1 << dst) | (1 << src)
+
+    def make_null_move(self):
+        # the side to move passes, undo with unmake_null_move before any unmake_move
+        self.zob_hash ^= self.ZOBRIST_SIDE
+        self.turn *= -1
+
+    def unmake_null_move(self):
+        self.zob_hash ^= self.ZOBRIST_SIDE
+        self.turn *= -1
+
+    def copy(self, incremental=None):
+        # like BitboardGameState.copy the history is not copied
+        # incremental is accepted for compatibility, the copy is never incremental
+        return CompiledGameState(self.tigers_bb, self.goats_bb, self.turn, self.goats_to_place, self.goats_eaten,
+                                 self.MOVE_MASKS, self.CAPTURE_COUNTS, self.CAPTURE_MASKS, self.REACH_MASKS,
+                                 self.ZOBRIST_PIECE, self.ZOBRIST_SIDE, self.ZOBRIST_TO_PLACE, self.ZOBRIST_EATEN)
+
+
+def new_compiled_state(tigers_bb=(1 << 0) | (1 << 4) | (1 << 20) | (1 << 24),
+                       goats_bb=0,
+                       turn=Piece_GOAT,
+                       goats_to_place=20,
+                       goats_eaten=0):
+    """Same arguments and defaults as BitboardGameState()."""
+    return CompiledGameState(tigers_bb, goats_bb, turn, goats_to_place, goats_eaten,
+                             MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP, REACH_MASKS_NP,
+                             ZOBRIST_PIECE, int(ZOBRIST_SIDE), ZOBRIST_TO_PLACE, ZOBRIST_EATEN)
+
+
+def to_compiled_state(state: BitboardGameState):
+    # the history is not carried over, as with copy()
+    return new_compiled_state(state.tigers_bb, state.goats_bb, state.turn,
+                              state.goats_to_place, state.goats_eaten)
+
+
+@njit
+def perft_state(state, depth, moves_buf):
+    # perft over a CompiledGameState, moves_buf: (depth, MAX_MOVES, 2)
+    if depth == 0:
+        return 1
+    if state.is_game_over:
+        return 0
+
+    moves = moves_buf[depth - 1]
+    n = state.generate_moves(False, moves)
+    nodes = 0
+    for i in range(n):
+        state.make_move((moves[i, 0], moves[i, 1]))
+        nodes += perft_state(state, depth - 1, moves_buf)
+        state.unmake_move()
+    return nodes
+
+
+def perft_compiled_state(state, depth):
+    if isinstance(state, BitboardGameState):
+        state = to_compiled_state(state)
+    moves_buf = np.empty((max(depth, 1), MAX_MOVES, 2), dtype=np.int64)
+    return perft_state(state, depth, moves_buf)
+
+
+def _check(expected, actual, what):
+    # not an assert statement, so the check still runs under python -O
+    if expected != actual:
+        raise AssertionError(f"{what}: BitboardGameState {expected} != CompiledGameState {actual}")
+
+
+def _snapshot(state):
+    packed_moves = [int(move) for move in state.get_packed_moves()]
+    return (state.tigers_bb, state.goats_bb, state.turn, state.goats_to_place, state.goats_eaten,
+            state.key, state.get_result, state.trapped_tiger_count,
+            state.potential_captures, state.goats_on_board,
+            [tuple(map(int, move)) for move in state.get_legal_moves()],
+            [tuple(map(int, move)) for move in state.get_legal_moves(True)],
+            packed_moves, [int(move) for move in state.get_packed_moves(True)],
+            [bool(state.is_quiet(move)) for move in packed_moves])
+
+
+def check_equivalence(games=200, seed=0):
+    """
+    Plays random games from every benchmark position on a BitboardGameState and a
+    CompiledGameState side by side, and checks that both agree after every make_move,
+    unmake_move and null move. Odd games are played with packed moves.
+    Returns the no of positions compared, raises AssertionError on the first mismatch.
+    """
+    rng = random.Random(seed)
+    compared = 0
+    names = list(BENCHMARK_POSITIONS)
+    for game in range(games):
+        state = make_position(names[game % len(names)])
+        compiled = to_compiled_state(state)
+        snapshots = []
+        while not state.is_game_over and len(snapshots) < 300:
+            snapshot = _snapshot(state)
+            _check(snapshot, _snapshot(compiled), f"game {game} move {compared}")
+            snapshots.append(snapshot)
+            state.make_null_move()
+            compiled.make_null_move()
+            _check(_snapshot(state), _snapshot(compiled), f"game {game} null move")
+            state.unmake_null_move()
+            compiled.unmake_null_move()
+            move = rng.choice(state.get_packed_moves() if game % 2 else state.get_legal_moves())
+            state.make_move(move)
+            compiled.make_move(move)
+            compared += 1
+        _check(_snapshot(state), _snapshot(compiled), f"game {game} end")
+        # and back to the start
+        while snapshots:
+            state.unmake_move()
+            compiled.unmake_move()
+            snapshot = snapshots.pop()
+            _check(snapshot, _snapshot(state), f"game {game} unmake_move")
+            _check(snapshot, _snapshot(compiled), f"game {game} unmake_move")
+            compared += 1
+    return compared
+
+
+if __name__ == "__main__":
+    # usage: python compiled_state.py [games]
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    try:
+        print(f"[compiled state] {check_equivalence(games)} positions match BitboardGameState")
+    except AssertionError as e:
+        print(f"[compiled state] MISMATCH {e}")
+        sys.exit(1)
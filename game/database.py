@@ -2,6 +2,7 @@ import sqlite3
 import json
 from datetime import datetime
 from typing import List, Dict, Optional
+from bagchal import pack_move
 
 
 DATABASE_FILE = "bagchal_games.db"
@@ -50,13 +51,15 @@ def save_game(game_state, game_mode: str, winner: Optional[str]) -> Optional[int
         # Serialize moves from game_state.history
         # History format: [(move_tuple, captured_pos), ...]
         # where move_tuple = (src, dst) and captured_pos is position or -1
+        # "move" is the packed move, "from"/ "to" are kept for games saved before it was added
         moves_list = []
         for move, captured_pos in game_state.history:
             src, dst = move
             moves_list.append({
                 "from": src,
                 "to": dst,
-                "capture": captured_pos if captured_pos != -1 else None
+                "capture": captured_pos if captured_pos != -1 else None,
+                "move": pack_move(move)
             })
 
         moves_json = json.dumps(moves_list)
@@ -5,6 +5,7 @@ import pygame
 from bagchal import *
 from negamax import AlphaBetaAgent
 from mcts import MCTS
+from ponder import Ponderer
 from .constants import UIState, ASSETS, COLORS
 from .effects import ParticleEffect
 from .renderer import GameRenderer
@@ -37,6 +38,9 @@ class Game:
         self.time_limit = 1.0
         self.ai_is_thinking = False
         self.ai_result_move = None
+        # keep searching on the human's time in the PvC modes
+        self.pondering = True
+        self.ponderer = None
         self.game_over_timer = 0
         self.game_over_delay = 1000
 
@@ -82,6 +86,7 @@ class Game:
         self.replay_timer = 0
         self.replay_auto_play_delay = 1000
         self.ai_suggestions = {}  # Cache AI suggestions for replay positions
+        self.replay_suggestions = 3  # No of ranked moves in the suggestion panel (multi-PV)
 
         self.initialize_sounds()
 
@@ -427,6 +432,16 @@ class Game:
         if self.ai_thread and self.ai_thread.is_alive():
             self.ai_thread.join()
         self.ai_thread = None
+        if self.ponderer:
+            self.ponderer.stop()
+
+    def start_pondering(self):
+        if not self.pondering or self.current_state not in (UIState.PLAYING_PVC_GOAT, UIState.PLAYING_PVC_TIGER):
+            return
+        agent = self.minimax_agent if self.using_agent == minimax_flag else self.mcts_agent
+        if self.ponderer is None or self.ponderer.agent is not agent:
+            self.ponderer = Ponderer(agent)
+        self.ponderer.start(self.game_state, game_history=self.state_hash.keys())
 
     def _initialize_ai_async(self):
         try:
@@ -461,7 +476,11 @@ class Game:
 
     def _ai_worker(self, agent, game_state):
         try:
-            if hasattr(agent, "search"):
+            if self.ponderer and self.ponderer.agent is agent:
+                # finishes or stops the ponder search first
+                move = self.ponderer.get_best_move(
+                    game_state, time_limit=self.time_limit, game_history=self.state_hash.keys())
+            elif hasattr(agent, "search"):
                 move = agent.search(
                     game_state, time_limit=self.time_limit, game_history=self.state_hash.keys())
             else:
@@ -519,6 +538,8 @@ class Game:
         if self.is_game_over():
             if self.game_over_timer == 0:
                 self.game_over_timer = pygame.time.get_ticks()
+                if self.ponderer:
+                    self.ponderer.stop()
                 # Auto-save game when it ends
                 if self.current_game_mode is not None and not self.replay_mode:
                     result = self.game_state.get_result
@@ -676,6 +697,7 @@ class Game:
             self.state_hash_update()
             self.move_processed_this_frame = True
             self.last_move_frame = current_frame
+            self.start_pondering()
             if MOVE_MASKS[move[0]] & (1 << move[1]) or move[0] == move[1]:
                 self.placement_sound.play()
             else:
@@ -758,7 +780,8 @@ class Game:
             return
 
         move_data = self.replay_moves[self.replay_index]
-        move = (move_data["from"], move_data["to"])
+        # older games only have "from"/ "to"
+        move = move_data.get("move", (move_data["from"], move_data["to"]))
 
         # Make the move (game_state.make_move handles capture info internally)
         self.game_state.make_move(move)
@@ -787,7 +810,10 @@ class Game:
             self.replay_timer = pygame.time.get_ticks()
 
     def get_ai_suggestion_for_position(self):
-        """Get AI suggested move for current replay position."""
+        """
+        Get AI suggested moves for current replay position: the replay_suggestions best moves
+        as [(move, score, pv), ...] best first, score from the side to move's point of view.
+        """
         # Check cache first
         if self.replay_index in self.ai_suggestions:
             return self.ai_suggestions[self.replay_index]
@@ -803,16 +829,17 @@ class Game:
                 self.minimax_agent = AlphaBetaAgent()
                 self.ai_initialized = True
 
-            # Get suggested move with short time limit for replay
-            suggested_move = self.minimax_agent.get_best_move(
+            # Get suggested moves with short time limit for replay (one multi-PV search)
+            suggestions = self.minimax_agent.get_best_moves(
                 self.game_state,
+                k=self.replay_suggestions,
                 time_limit=0.5,
                 game_history=[]
             )
 
             # Cache the suggestion
-            self.ai_suggestions[self.replay_index] = suggested_move
-            return suggested_move
+            self.ai_suggestions[self.replay_index] = suggestions
+            return suggestions
         except Exception as e:
             print(f"Error getting AI suggestion: {e}")
             return None
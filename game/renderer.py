@@ -591,7 +591,7 @@ class GameRenderer:
         suggestion_panel_x = x_width - 300
         suggestion_panel_y = 100
         suggestion_panel_width = 300
-        suggestion_panel_height = 150
+        suggestion_panel_height = 190
 
         panel_rect = pygame.Rect(
             suggestion_panel_x, suggestion_panel_y,
@@ -607,24 +607,41 @@ class GameRenderer:
                        suggestion_panel_x + suggestion_panel_width // 2,
                        suggestion_panel_y + 20, COLORS["accent"])
 
-        # Get AI suggestion
+        # Get AI suggestions (ranked, with scores for the side to move)
         if not self.game.game_state.is_game_over:
-            suggested_move = self.game.get_ai_suggestion_for_position()
-            if suggested_move:
-                from_pos, to_pos = suggested_move
-                suggestion_text = f"Move: ({from_pos}, {to_pos})"
-                agent_text = "Negamax"
+            suggestions = self.game.get_ai_suggestion_for_position()
+            if suggestions:
+                suggestion_texts = []
+                for rank, (move, score, _) in enumerate(suggestions, 1):
+                    from_pos, to_pos = move
+                    score_text = "" if score is None else f"  {score:+.2f}"
+                    suggestion_texts.append(f"{rank}. ({from_pos}, {to_pos}){score_text}")
+                agent_text = "Agent: Negamax"
+
+                # How the move actually played compares to the best one
+                if self.game.replay_index < len(self.game.replay_moves):
+                    move_data = self.game.replay_moves[self.game.replay_index]
+                    played = (move_data["from"], move_data["to"])
+                    ranked = {move: (rank, score) for rank, (move, score, _) in enumerate(suggestions, 1)}
+                    if played not in ranked:
+                        agent_text = f"Played: not in the top {len(suggestions)}"
+                    else:
+                        rank, score = ranked[played]
+                        best_score = suggestions[0][1]
+                        gap = "" if score is None or best_score is None else f" ({score - best_score:+.2f})"
+                        agent_text = f"Played: #{rank}{gap}"
             else:
-                suggestion_text = "Calculating..."
+                suggestion_texts = ["Calculating..."]
                 agent_text = ""
 
-            self.draw_text(suggestion_text, 18,
-                           suggestion_panel_x + suggestion_panel_width // 2,
-                           suggestion_panel_y + 60, COLORS["white"])
+            for i, suggestion_text in enumerate(suggestion_texts):
+                self.draw_text(suggestion_text, 18,
+                               suggestion_panel_x + suggestion_panel_width // 2,
+                               suggestion_panel_y + 55 + 28 * i, COLORS["white"])
             if agent_text:
-                self.draw_text(f"Agent: {agent_text}", 14,
+                self.draw_text(agent_text, 14,
                                suggestion_panel_x + suggestion_panel_width // 2,
-                               suggestion_panel_y + 90, COLORS["white"])
+                               suggestion_panel_y + suggestion_panel_height - 25, COLORS["white"])
         else:
             self.draw_text("Game Over!", 18,
                            suggestion_panel_x + suggestion_panel_width // 2,
@@ -1,6 +1,13 @@
 import time
 import numpy as np
 from bagchal import *
+from symmetry import canonical_key, transform_moves, SYM_INVERSE
+
+# the class level caches are cleared once they grow past this many entries
+CACHE_LIMIT = 50_000
+# a search stops once its tree has this many nodes (about one per simulation). A search without
+# a time limit (pondering, see ponder.py) would otherwise grow the tree until memory runs out
+MAX_TREE_NODES = 500_000
 
 
 class Node:
@@ -12,7 +19,7 @@ class Node:
     def __init__(self, total_value=0.0,
                  visit_count=0, parent=None, move=None, player_to_move=None):
         self.parent: Node = parent
-        self.move = move  # incoming move
+        self.move = move  # incoming move, packed
         self.player_to_move = player_to_move
         self.unexpanded_moves = None  # Lazy Expansion
         self.children = []
@@ -26,16 +33,23 @@ class Node:
 
 
 class MCTS:
+    # both caches are keyed by the canonical (symmetry reduced) key of the position
     previous_evaluations = {}
+    # canonical key -> packed legal moves in the canonical orientation
     legal_moves_cache = {}
 
-    def __init__(self):
+    def __init__(self, max_nodes=MAX_TREE_NODES):
         self.rollout_epsilon = 0.05
         # it feels to me that, setting a smaller rollout depth is akin to the idea
         # of quiescene in alpha beta search. like instead of statically evaluating
         # the leaf, we're basically extending the horizon some moves ahead to obtain
         # a more stable evaluation of the state
         self.rollout_depth = 5
+        self.root = None
+        # set from another thread to end the search early (see ponder.py)
+        self.stop_event = None
+        self.max_nodes = max_nodes
+        self.tree_nodes = 0
 
     def search(self, initial_state: BitboardGameState, max_simulations=1000, time_limit=None, game_history=None):
         print("Searching move...")
@@ -43,12 +57,10 @@ class MCTS:
 
         self.game_state = initial_state.copy()
 
-        if len(self.legal_moves_cache) >= 50_000:
-            self.legal_moves_cache.clear()
-        if len(self.previous_evaluations) >= 50_000:
-            self.previous_evaluations.clear()
+        self.limit_caches()
 
         self.root = Node(player_to_move=self.game_state.turn)
+        self.tree_nodes = 1
         self.simulations_run = 0
         self.goat_wins = 0
         self.tiger_wins = 0
@@ -67,11 +79,14 @@ class MCTS:
 
             self.backpropagate(result, path_nodes)
 
-            # we call unmake_move until the game_state.history is empty
+            # we call unmake_move until there are no moves left to undo
             # to reset the game_state to initial_state for next iteration
             self.undo_path_to_root()
 
             self.simulations_run += 1
+            # a long search (pondering) fills the caches too, not only one search after another
+            if self.simulations_run & 1023 == 0:
+                self.limit_caches()
             if result == Piece_TIGER:
                 self.tiger_wins += 1
             elif result == Piece_GOAT:
@@ -81,10 +96,10 @@ class MCTS:
 
         if time_limit is not None:
             end_time = time.time() + time_limit
-            while time.time() < end_time:
+            while time.time() < end_time and not self.stopped():
                 search_helper()
         else:
-            while self.simulations_run < max_simulations:
+            while self.simulations_run < max_simulations and not self.stopped():
                 search_helper()
         best_move = self.get_best_move()
         print(f"Best move: {best_move}")
@@ -97,7 +112,30 @@ class MCTS:
         # max_child: Node = self.root.best_child(c_param=0)
         most_visited_child = max(
             self.root.children, key=lambda c: c.visit_count)
-        return most_visited_child.move
+        return MOVE_TUPLE[most_visited_child.move]
+
+    def expected_reply(self):
+        """The most visited reply to the best move of the last search, None if it wasn't expanded."""
+        if self.root is None or not self.root.children:
+            return None
+        best_child = max(self.root.children, key=lambda c: c.visit_count)
+        if not best_child.children:
+            return None
+        reply = max(best_child.children, key=lambda c: c.visit_count)
+        return MOVE_TUPLE[reply.move]
+
+    def stopped(self):
+        # a stopped search still needs one expanded move to return
+        if not self.root.children:
+            return False
+        return (self.tree_nodes >= self.max_nodes
+                or self.stop_event is not None and self.stop_event.is_set())
+
+    def limit_caches(self):
+        if len(self.legal_moves_cache) >= CACHE_LIMIT:
+            self.legal_moves_cache.clear()
+        if len(self.previous_evaluations) >= CACHE_LIMIT:
+            self.previous_evaluations.clear()
 
     def tree_policy(self):
         # Selection + Expansion
@@ -124,11 +162,11 @@ class MCTS:
                 # hopefully will help overcome the cold start problem
                 if current_node.player_to_move == Piece_TIGER:
                     p_score = tiger_priority(
-                        self.game_state.tigers_bb, self.game_state.goats_bb, move, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
+                        self.game_state.tigers_bb, self.game_state.goats_bb, MOVE_TUPLE[move], MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
 
                 else:
                     p_score = goat_priority(
-                        self.game_state.tigers_bb, self.game_state.goats_bb, move, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP, OUTER_EDGE_MASK, STRATEGIC_MASK)
+                        self.game_state.tigers_bb, self.game_state.goats_bb, MOVE_TUPLE[move], MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP, OUTER_EDGE_MASK, STRATEGIC_MASK)
 
                 priority_score_norm = -1 * np.tanh(0.1 * p_score)
 
@@ -147,6 +185,7 @@ class MCTS:
                     player_to_move=self.game_state.turn
                 )
                 current_node.children.append(new_child)
+                self.tree_nodes += 1
                 path_nodes.append(new_child)
 
                 return path_nodes
@@ -178,6 +217,7 @@ class MCTS:
     # Move Prioritization
 
     def _score_move(self,  move):
+        move = MOVE_TUPLE[move]
         if self.game_state.turn == Piece_TIGER:
             return tiger_priority(self.game_state.tigers_bb, self.game_state.goats_bb, move, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
         else:
@@ -185,12 +225,19 @@ class MCTS:
 
     def get_prioritized_moves(self):
 
-        state_key = self.game_state.key
+        state_key, sym = canonical_key(self.game_state)
         if state_key in self.legal_moves_cache:
             moves = self.legal_moves_cache[state_key]
+            if sym:
+                # back to the orientation of the current position
+                moves = transform_moves(moves, SYM_INVERSE[sym])
         else:
-            moves = self.game_state.get_legal_moves()
-            self.legal_moves_cache[state_key] = moves
+            moves = self.game_state.get_packed_moves()
+            if sym:
+                self.legal_moves_cache[state_key] = transform_moves(
+                    moves, sym)
+            else:
+                self.legal_moves_cache[state_key] = moves
 
         scored_moves = [(move, self._score_move(move))
                         for move in moves]
@@ -224,8 +271,10 @@ class MCTS:
         if self.game_state.is_game_over:
             result = self.game_state.get_result
         else:
+            # the evaluation is the same for all symmetric positions
+            state_key, _ = canonical_key(self.game_state)
             result = np.tanh(
-                0.5 * self.evaluate_state(self.game_state, self.game_state.key))
+                0.5 * self.evaluate_state(self.game_state, state_key))
 
         # result = np.tanh(
         #     0.5 * self.evaluate_state(self.game_state, self.game_state.key))
@@ -244,19 +293,9 @@ class MCTS:
         Undo all moves taken during tree traversal to return to root state
         """
 
-        while self.game_state.history:
+        while self.game_state.history_len:
             self.game_state.unmake_move()
 
-    def _get_potential_captures(self, state: BitboardGameState, empty_bb):
-
-        capture_opportunities = 0
-        for tiger in extract_indices_fast(state.tigers_bb):
-            for mid_mask, land_mask in CAPTURE_MASKS[tiger]:
-                if (state.goats_bb & mid_mask) and (empty_bb & land_mask):
-                    capture_opportunities += 1
-
-        return capture_opportunities
-
     def _get_tiger_accessibility(self, state: BitboardGameState):
         accessible, inaccessible = tiger_board_accessibility(
             state.tigers_bb, state.goats_bb,
@@ -267,9 +306,6 @@ class MCTS:
         """
         Positive -> TIGER advantage, Negative -> GOAT advantage.
         """
-        occupied_bb = state.tigers_bb | state.goats_bb
-        empty_bb = ~occupied_bb & BOARD_MASK
-
         assert state_key
 
         if state_key in self.previous_evaluations:
@@ -298,8 +334,7 @@ class MCTS:
 
         eaten_score = eaten / eat_max
 
-        potential_captures = self._get_potential_captures(
-            state, empty_bb)
+        potential_captures = state.potential_captures
         potential_capture_score = potential_captures / potential_capture_max
         potential_capture_score = min(1, potential_capture_score)
 
@@ -334,7 +369,7 @@ class MCTS:
             return
 
         connector = "└── " if is_last else "├── "
-        move_str = f"Move: {node.move}" if node.move != None else "Root"
+        move_str = f"Move: {MOVE_TUPLE[node.move]}" if node.move != None else "Root"
         wins = node.total_value
         avg_value = wins / node.visit_count if node.visit_count > 0 else 0
         print(
@@ -1,167 +1,941 @@
 import time
-from collections import defaultdict
+from dataclasses import dataclass, field
+from numba import njit
+import numpy as np
 from bagchal import *
+from symmetry import canonical_key, transform_move, SYM_INVERSE
 
 EXACT_FLAG, ALPHA_FLAG, BETA_FLAG = 0, 1, 2
 MAX_PLY = 64
 CONTEMPT = -20.0
+# delta pruning: the most a single capture can gain in the evaluation
+# (one more goat eaten, and the potential capture, mobility and inaccessibility terms swinging all the way)
+QS_DELTA = w_eat / 4 + w_potcap + w_mobility + w_inacc
+# ... plus the placement bonus goat gets for an inaccessible region while no goat has been eaten
+QS_DELTA_FIRST_CAPTURE = QS_DELTA + 300
+# past this width an aspiration window that keeps failing is opened all the way
+ASPIRATION_MAX = 1000
+# scores beyond this are wins/ losses (or a repetition), no pruning decisions near them
+MATE_BOUND = 1000
+
+# Selective search
+# late move reductions: quiet moves late in the ordering (not the TT move or a killer) are searched
+# 1 ply shallower, 2 past LMR_LATE_MOVES, and again at full depth only if they beat alpha
+LMR_LATE_MOVES = 9
+# null-move pruning, tiger only: zugzwang is common for goat (see docs.txt). Tiger passing in
+# a position that still fails high after a reduced search is cut, after a verification search
+# (the real moves at the reduced depth) also fails high. Not near a trap either.
+NULL_MOVE_R = 2
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_MAX_TRAPPED = 2
+# futility pruning: at depth <= FUTILITY_DEPTH, quiet moves (BitboardGameState.is_quiet) are skipped
+# when the static evaluation plus depth * FUTILITY_MARGIN can't reach alpha. The largest swing of
+# one quiet move measured over ~17k random positions is 52 (goat moving, both sides ~40-50)
+FUTILITY_DEPTH = 2
+FUTILITY_MARGIN = 55
+# ... plus the placement bonus for an inaccessible region, which only a goat placement can make
+# (~0.2% of quiet placements did, no quiet tiger move can break one)
+FUTILITY_PLACEMENT = 300
+
+
+# move ordering bonuses on top of tiger_priority/ goat_priority
+TT_MOVE_BONUS = 5000
+KILLER_BONUSES = (1000, 900)
 
 
 class TimeoutError(Exception):
     ...
 
 
-class PV_Line(list):
-    ...
+# Transposition table
+# preallocated numpy table indexed by the low bits of the key, so memory use stays the same
+# however long the search runs. Each bucket has TT_WAYS slots: slot 0 keeps the deepest entry
+# (depth preferred), slot 1 takes whatever doesn't go into slot 0 (always replace).
+# a slot is TT_SLOT_WORDS int64s: [key ^ data ^ score, data, score]
+#   the key is stored xored with the other two words, so an entry torn by two processes writing
+#   the same slot at once (see parallel.py, the table can live in shared memory) fails the key
+#   check instead of returning a mix of two entries. No locks needed.
+#   data: move | depth << TT_DEPTH_SHIFT | flag << TT_FLAG_SHIFT | TT_USED | generation << TT_GEN_SHIFT
+#         (| TT_REPETITION)
+#   generation: the search the entry was written in. When the table is kept between moves,
+#   entries from earlier searches are still probed but are the first to be replaced.
+#   TT_REPETITION: the score depends on a repetition (game_history/ tree_history), which is only
+#   true on the path the entry was written from. Its score is not reused by a later search, only its move.
+#   score: the bits of the float64 score. Win/ loss scores (beyond MATE_BOUND) are stored relative
+#   to the node (distance from the node rather than from the root), see tt_store/ tt_probe
+TT_WAYS = 2
+TT_SLOT_WORDS = 3
+TT_NO_MOVE = NUM_PACKED_MOVES - 1
+TT_DEPTH_SHIFT = 11
+TT_FLAG_SHIFT = 19
+TT_USED = 1 << 21
+TT_GEN_SHIFT = 22
+TT_GEN_MASK = 0xFF
+TT_REPETITION = 1 << 30
+# stats: probes, hits (key found), stores
+TT_PROBES, TT_HITS, TT_STORES = 0, 1, 2
+
+
+@njit(cache=True)
+def tt_probe(table, key, depth, alpha, beta, ply, generation, stats):
+    """
+    Returns (usable, score, move, repetition). usable is True if the entry is deep enough and its
+    bound lets the caller return score right away. move is TT_NO_MOVE on a miss.
+    repetition: the score depends on a repetition (TT_REPETITION), such entries are only
+    usable in the generation that wrote them.
+    """
+    stats[TT_PROBES] += 1
+    index = key & (table.shape[0] - 1)
+    for way in range(TT_WAYS):
+        # every word is read once: the score is the validated score_bits, not a second read
+        # of the slot that another process may have written in between
+        data = table[index, way, 1]
+        score_bits = table[index, way, 2]
+        score = np.int64(score_bits).view(np.float64)
+        if table[index, way, 0] ^ data ^ score_bits == key and data & TT_USED:
+            stats[TT_HITS] += 1
+            move = data & TT_NO_MOVE
+            repetition = data & TT_REPETITION != 0
+            # stored relative to the node, the caller wants it relative to the root
+            if score > MATE_BOUND:
+                score -= ply
+            elif score < -MATE_BOUND:
+                score += ply
+            if ((data >> TT_DEPTH_SHIFT) & 0xFF >= depth
+                    and not (repetition and (data >> TT_GEN_SHIFT) & TT_GEN_MASK != generation)):
+                flag = (data >> TT_FLAG_SHIFT) & 3
+                if (flag == EXACT_FLAG or (flag == ALPHA_FLAG and score <= alpha)
+                        or (flag == BETA_FLAG and score >= beta)):
+                    return True, score, move, repetition
+            return False, score, move, repetition
+    return False, 0.0, TT_NO_MOVE, False
+
+
+@njit(cache=True)
+def tt_store(table, key, depth, score, flag, move, ply, repetition, generation, stats):
+    stats[TT_STORES] += 1
+    if score > MATE_BOUND:
+        score += ply
+    elif score < -MATE_BOUND:
+        score -= ply
+    index = key & (table.shape[0] - 1)
+    data = table[index, 0, 1]
+    way = 1
+    if (not data & TT_USED or depth >= (data >> TT_DEPTH_SHIFT) & 0xFF
+            or (data >> TT_GEN_SHIFT) & TT_GEN_MASK != generation):
+        way = 0
+
+    data = table[index, way, 1]
+    if (move == TT_NO_MOVE and data & TT_USED
+            and table[index, way, 0] ^ data ^ table[index, way, 2] == key):
+        # keep the move of the previous entry for the same position
+        move = data & TT_NO_MOVE
+
+    data = (move | min(depth, 0xFF) << TT_DEPTH_SHIFT | flag << TT_FLAG_SHIFT | TT_USED
+            | generation << TT_GEN_SHIFT)
+    if repetition:
+        data |= TT_REPETITION
+    score_bits = np.float64(score).view(np.int64)
+    table[index, way, 2] = score_bits
+    table[index, way, 1] = data
+    table[index, way, 0] = key ^ data ^ score_bits
+
+
+@njit(cache=True)
+def score_moves(tigers_bb, goats_bb, turn, moves, n, tt_move, killer1, killer2, history, scores,
+                MOVE_SRC, MOVE_DST, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS, OUTER_EDGE_MASK, STRATEGIC_MASK):
+    """
+    Writes the ordering score of moves[:n] into scores[:n]: the move priority plus the TT move,
+    killer or (quiet moves only) history bonus. killers and tt_move are TT_NO_MOVE if there are none.
+    history: (25,) no of cutoffs by destination, for the side to move.
+    """
+    for i in range(n):
+        move = moves[i]
+        dst = MOVE_DST[move]
+        if turn == Piece_TIGER:
+            score = tiger_priority(tigers_bb, goats_bb, (MOVE_SRC[move], dst),
+                                   MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS)
+        else:
+            score = goat_priority(tigers_bb, goats_bb, (MOVE_SRC[move], dst),
+                                  MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS, OUTER_EDGE_MASK, STRATEGIC_MASK)
+        if move == tt_move:
+            score += TT_MOVE_BONUS
+        elif move == killer1:
+            score += KILLER_BONUSES[0]
+        elif move == killer2:
+            score += KILLER_BONUSES[1]
+        elif turn == Piece_GOAT or not move & MOVE_CAPTURE_FLAG:
+            score += history[dst]
+        scores[i] = score
+
+
+@njit(cache=True)
+def pick_next(moves, scores, i, n):
+    """Swaps the best scored of moves[i:n] (the first one on a tie) into moves[i] and returns it."""
+    best = i
+    for j in range(i + 1, n):
+        if scores[j] > scores[best]:
+            best = j
+    moves[i], moves[best] = moves[best], moves[i]
+    scores[i], scores[best] = scores[best], scores[i]
+    return moves[i]
+
+
+def table_entries(size_mb, entry_bytes):
+    # the largest power of two no of entries that fits in size_mb
+    n_entries = 1
+    while n_entries * 2 * entry_bytes <= size_mb * 1024 * 1024:
+        n_entries *= 2
+    return n_entries
+
+
+def tt_buckets(size_mb):
+    return table_entries(size_mb, TT_WAYS * TT_SLOT_WORDS * 8)
 
 
-class TTEntry:
-    def __init__(self, state_key, depth, evaluation, flag, best_move):
-        self.state_key = state_key
-        self.depth = depth
-        self.evaluation = evaluation
-        self.flag = flag
-        self.best_move = best_move
+class TT:
+    def __init__(self, size_mb=16, table=None):
+        # table: use an existing (n_buckets, TT_WAYS, TT_SLOT_WORDS) int64 array instead of allocating one
+        if table is None:
+            table = np.zeros((tt_buckets(size_mb), TT_WAYS, TT_SLOT_WORDS), dtype=np.int64)
+        self.table = table
+        self.stats = np.zeros(3, dtype=np.int64)
+        self.generation = 0
+
+    def put(self, state_key, depth, evaluation, flag, best_move, ply=0, repetition=False):
+        # ply: of the node, for the win/ loss scores. repetition: see TT_REPETITION
+        tt_store(self.table, state_key, depth, float(evaluation), flag,
+                 TT_NO_MOVE if best_move is None else best_move, ply, repetition, self.generation, self.stats)
+
+    def get(self, state_key, depth, alpha, beta, ply=0):
+        """(score or None if the entry can't be used, move or None, whether the score depends on a repetition)"""
+        usable, score, move, repetition = tt_probe(self.table, state_key, depth, float(alpha), float(beta),
+                                                   ply, self.generation, self.stats)
+        if move == TT_NO_MOVE:
+            move = None
+        return (score if usable else None), move, repetition
 
+    def clear(self):
+        self.table.fill(0)
+        self.stats.fill(0)
+        self.generation = 0
+
+    def new_search(self):
+        # keep the entries, but mark everything written so far as stale
+        self.generation = (self.generation + 1) & TT_GEN_MASK
+        self.stats.fill(0)
+
+    @property
+    def size_mb(self):
+        return self.table.nbytes / (1024 * 1024)
+
+    def fill_rate(self):
+        used = np.count_nonzero(self.table[:, :, 1] & TT_USED)
+        return used / (self.table.shape[0] * TT_WAYS)
+
+    def hit_rate(self):
+        return self.stats[TT_HITS] / max(self.stats[TT_PROBES], 1)
+
+
+# Principal variation
+# triangular table: row ply holds the best line found so far by the node at ply, in columns ply to
+# length[ply] - 1. A node starts with an empty line (init_node) and whenever a move raises alpha it
+# takes that move followed by the line of its child (update). Row 0 is the PV of the root.
+# preallocated lists of lists rather than a numpy table: the table is driven one element at a time
+# from python, where a list store is cheaper than a numpy scalar store (see python benchmark.py pv)
+# PV following: before every iteration follow() remembers the key of every position along the PV
+# so far, and a node at one of those positions (and plies) tries the PV move first.
+class PVTable:
+    def __init__(self, max_ply=MAX_PLY):
+        self.moves = [[TT_NO_MOVE] * (max_ply + 1) for _ in range(max_ply + 1)]
+        self.length = [0] * (max_ply + 1)
+        self.follow_keys = []
+        self.follow_moves = []
 
-class TT:
-    def __init__(self):
-        self.entries = {}
+    def clear(self):
+        self.length[:] = [0] * len(self.length)
+        self.follow_keys = []
+        self.follow_moves = []
+
+    def init_node(self, ply):
+        self.length[ply] = ply
+
+    def update(self, ply, move):
+        row = self.moves[ply]
+        row[ply] = move
+        length = self.length[ply + 1]
+        row[ply + 1:length] = self.moves[ply + 1][ply + 1:length]
+        self.length[ply] = length if length > ply else ply + 1
+
+    def line(self, ply=0):
+        """The PV of the node at ply as packed moves."""
+        return self.moves[ply][ply:self.length[ply]]
+
+    def follow(self, state, line=None):
+        """Call before an iteration: state is the root, the current PV (or line) is searched first."""
+        self.follow_moves = self.line() if line is None else list(line)
+        self.follow_keys = []
+        for move in self.follow_moves:
+            self.follow_keys.append(state.key)
+            state.make_move(move)
+        for _ in self.follow_moves:
+            state.unmake_move()
+
+    def pv_move(self, ply, state_key):
+        """The move to search first at the node at ply, TT_NO_MOVE if it isn't on the followed PV."""
+        if ply < len(self.follow_keys) and self.follow_keys[ply] == state_key:
+            return self.follow_moves[ply]
+        return TT_NO_MOVE
+
+
+# Evaluation cache
+# static evaluations of the leaves (tiger's point of view) by position key, in a fixed no of slots
+# indexed by the low bits of the key like the TT, but one always replaced slot per index: losing an
+# entry only costs an evaluation. The evaluation doesn't depend on the search, so entries stay
+# valid across iterations and moves and the cache is never cleared between searches.
+# plain lists rather than a numpy table and a compiled probe like the TT: a probe is a couple of
+# list lookups, a numba call would cost about as much as the evaluation it saves.
+# the size is estimated from what a filled slot takes: 2 list pointers, an int key and a float
+EVAL_SLOT_BYTES = 8 + 8 + 32 + 24
+
+
+class EvalCache:
+    def __init__(self, size_mb=4):
+        self.n_slots = table_entries(size_mb, EVAL_SLOT_BYTES)
+        self.mask = self.n_slots - 1
+        self.keys = [None] * self.n_slots
+        self.scores = [0.0] * self.n_slots
+        self.probes = 0
+        self.hits = 0
+
+    def get(self, state_key):
+        self.probes += 1
+        index = state_key & self.mask
+        if self.keys[index] == state_key:
+            self.hits += 1
+            return self.scores[index]
+        return None
+
+    def put(self, state_key, evaluation):
+        index = state_key & self.mask
+        self.keys[index] = state_key
+        self.scores[index] = evaluation
 
-    def put(self, entry: TTEntry):
-        # always replace scheme
-        # self.entries[entry.state_key] = entry
+    def clear(self):
+        self.keys = [None] * self.n_slots
+        self.scores = [0.0] * self.n_slots
+        self.probes = 0
+        self.hits = 0
 
-        # depth preferred scheme
-        hashed_entry = self.entries.get(entry.state_key, None)
-        if hashed_entry:
-            if entry.depth >= hashed_entry.depth:
-                self.entries[entry.state_key] = entry
-            return
-        self.entries[entry.state_key] = entry
+    def new_search(self):
+        # the entries are kept, only the stats start over
+        self.probes = 0
+        self.hits = 0
 
-    def get(self, state_key, depth, alpha, beta):
-        entry = self.entries.get(state_key, None)
-        if entry is None:
-            return None, None
+    @property
+    def size_mb(self):
+        return self.n_slots * EVAL_SLOT_BYTES / (1024 * 1024)
 
-        if entry.depth >= depth:
-            if entry.flag == EXACT_FLAG:
-                return entry.evaluation, entry.best_move
+    def fill_rate(self):
+        return (self.n_slots - self.keys.count(None)) / self.n_slots
 
-            if entry.flag == ALPHA_FLAG and entry.evaluation <= alpha:
-                return entry.evaluation, entry.best_move
+    def hit_rate(self):
+        return self.hits / max(self.probes, 1)
 
-            if entry.flag == BETA_FLAG and entry.evaluation >= beta:
-                return entry.evaluation, entry.best_move
 
-        return None, entry.best_move
+# Time management
+# time_limit is the hard limit: past it the running iteration is aborted (its best root move so far
+# is still played). A new iteration isn't started past the soft limit (soft_ratio * time_limit), nor
+# when it's predicted to run past the hard limit: the last iteration's time times the effective
+# branching factor. So the time of an aborted iteration is mostly spared rather than thrown away.
+# node_limit works the same way with node counts instead of seconds, for reproducible searches.
+# soft_ratio=None: keep iterating until the hard limit.
+TM_SOFT_RATIO = 0.6
+# the best move hasn't changed for this many iterations: stop at half the soft limit
+TM_STABLE_ITERATIONS = 4
 
-    def clear(self):
-        self.entries.clear()
+
+class TimeManager:
+    def __init__(self, time_limit=float('inf'), node_limit=None, soft_ratio=TM_SOFT_RATIO, stop_event=None):
+        self.time_limit = time_limit
+        self.soft_limit = None if soft_ratio is None else time_limit * soft_ratio
+        self.node_limit = node_limit
+        self.stop_event = stop_event
+        self.start_time = time.time()
+        # (depth, seconds, nodes, best move) at the end of every completed iteration
+        self.iterations = []
+        # why next_iteration returned False
+        self.stop_reason = None
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def out_of_time(self, nodes):
+        # the hard limits, checked during the search
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        if self.node_limit is not None and nodes >= self.node_limit:
+            return True
+        return self.elapsed() > self.time_limit
+
+    def iteration_done(self, depth, nodes, best_move):
+        self.iterations.append((depth, self.elapsed(), nodes, best_move))
+
+    def ebf(self):
+        """
+        Effective branching factor: how much the no of nodes grows from one iteration to the next,
+        averaged over the last two steps (odd and even depths grow differently). None before 2 iterations.
+        """
+        cumulative = [nodes for _, _, nodes, _ in self.iterations]
+        costs = [nodes - prev_nodes for prev_nodes, nodes in zip([0] + cumulative, cumulative)][-3:]
+        if len(costs) < 2 or costs[0] <= 0:
+            return None
+        return max((costs[-1] / costs[0]) ** (1 / (len(costs) - 1)), 1.0)
+
+    def next_iteration(self, single_move=False):
+        """Whether the next iteration should be started."""
+        elapsed = self.elapsed()
+        if self.soft_limit is None:
+            return True
+        if single_move:
+            self.stop_reason = "only one legal move"
+        elif elapsed > self.soft_limit:
+            self.stop_reason = "soft limit"
+        elif (len(self.iterations) >= TM_STABLE_ITERATIONS and elapsed > self.soft_limit / 2
+                and len({move for *_, move in self.iterations[-TM_STABLE_ITERATIONS:]}) == 1):
+            self.stop_reason = "best move stable"
+        else:
+            ebf = self.ebf()
+            if ebf is None:
+                return True
+            _, prev_elapsed, prev_nodes, _ = self.iterations[-2]
+            _, last_elapsed, last_nodes, _ = self.iterations[-1]
+            if elapsed + (last_elapsed - prev_elapsed) * ebf > self.time_limit:
+                self.stop_reason = f"next iteration predicted to run out of time (ebf {ebf:.1f})"
+            elif self.node_limit is not None and last_nodes + (last_nodes - prev_nodes) * ebf > self.node_limit:
+                self.stop_reason = f"next iteration predicted to run out of nodes (ebf {ebf:.1f})"
+            else:
+                return True
+        return False
+
+
+@dataclass
+class DepthStats:
+    """One completed iteration. nodes/ qnodes/ counters are for this iteration alone."""
+    depth: int
+    best_move: tuple
+    score: float
+    nodes: int
+    qnodes: int
+    elapsed: float  # seconds from the start of the search to the end of the iteration
+    nps: float
+    tt_probes: int
+    tt_hits: int
+    tt_cutoffs: int  # probes that returned a score right away
+    eval_probes: int  # evaluation cache, 0 without one
+    eval_hits: int
+    fail_highs: int  # beta cutoffs
+    first_move_fail_high_rate: float  # share of the cutoffs made by the first move searched
+    killer_rate: float  # share of the cutoffs made by a killer move
+    history_rate: float  # share of the cutoffs made by another quiet move with a history score
+    ebf: float  # nodes over the previous iteration's, None for the first one
+
+
+@dataclass
+class SearchStats:
+    """
+    get_best_move(return_stats=True) returns (move, SearchStats), dataclasses.asdict() makes it
+    json ready. Totals are over the whole search, including an aborted last iteration.
+    """
+    best_move: tuple = None
+    score: float = None
+    depth: int = 0
+    nodes: int = 0
+    qnodes: int = 0
+    elapsed: float = 0.0
+    nps: float = 0.0
+    stop_reason: str = None
+    futility_prunes: int = 0  # quiet moves skipped by futility pruning
+    eval_hit_rate: float = None  # evaluation cache, None without one
+    depths: list = field(default_factory=list)
 
 
 class AlphaBetaAgent():
-    def __init__(self):
+    def __init__(self, use_symmetry=True, tt_size_mb=16, keep_tt=False, history_decay=0.5,
+                 use_qsearch=False, window=None, window_growth=4, root_workers=0,
+                 use_lmr=False, lmr_min_moves=3, lmr_min_depth=3, use_null_move=False, use_futility=False,
+                 soft_time_ratio=TM_SOFT_RATIO, incremental_eval=True, eval_cache_mb=4):
         # half move counter
         self.ply = 0
         self.game_state: BitboardGameState
         self.no_of_nodes = 0
+        # nodes visited by qsearch (not counted in no_of_nodes)
+        self.no_of_qnodes = 0
+        # resolve pending tiger captures at the leaves instead of evaluating right away
+        self.use_qsearch = use_qsearch
+        # initial half width of the aspiration window around the previous depth's score,
+        # multiplied by window_growth on every fail high/ low. None searches every depth with a full window
+        self.window = window
+        self.window_growth = window_growth
+        self.researches = 0
+        # search statistics (see SearchStats), counted over the whole search
+        self.tt_cutoffs = 0
+        self.futility_prunes = 0
+        # no of scores that came from the repetition check (or a TT entry that depends on one)
+        self.repetitions = 0
+        self.fail_highs = 0
+        self.first_move_fail_highs = 0
+        self.killer_fail_highs = 0
+        self.history_fail_highs = 0
+        self.stats = None
+        # selective search, see the constants at the top
+        # the first lmr_min_moves moves of a node and nodes below lmr_min_depth are never reduced
+        self.use_lmr = use_lmr
+        self.lmr_min_moves = lmr_min_moves
+        self.lmr_min_depth = lmr_min_depth
+        self.use_null_move = use_null_move
+        self.use_futility = use_futility
+        # split the root moves across this many processes (see parallel.py), 0 = search here
+        self.root_workers = root_workers
+        self.root_pool = None
+        # no of root split searches, tells the workers when a new move starts
+        self.root_searches = 0
+        # score and PV (as (src, dst) moves) of the deepest completed iteration
+        self.score = None
+        self.pv = []
+        # the PV as the search collects it, see PVTable
+        self.pv_table = PVTable()
+        # set from another thread/ process to end the search early
+        # (checked together with the time limit)
+        self.stop_event = None
+        # no new iteration past soft_time_ratio * time_limit, see TimeManager (None: until time_limit)
+        self.soft_time_ratio = soft_time_ratio
+        self.time_manager = None
 
         # killer moves
-        # (ply, turn) -> killer1, killer2
-        self.killers = {}
-        # (square, turn) -> no of cutoffs
-        self.history = defaultdict(int)
+        # [ply, side] -> killer1, killer2 (TT_NO_MOVE if none), side: 0 goat, 1 tiger
+        self.killers = np.full((MAX_PLY, 2, 2), TT_NO_MOVE, dtype=np.int64)
+        # [side, destination square] -> no of cutoffs
+        self.history = np.zeros((2, 25), dtype=np.int64)
+        # moves of the node at every ply and their ordering scores (see score_moves)
+        self.move_stack = np.empty((MAX_PLY, MAX_MOVES), dtype=np.int64)
+        self.score_stack = np.empty((MAX_PLY, MAX_MOVES), dtype=np.float64)
         # transposition table
-        self.tt = TT()
+        self.tt = TT(tt_size_mb)
+        # keep the TT and the history heuristic from one move to the next
+        # the history is scaled by history_decay before every search
+        self.keep_tt = keep_tt
+        self.history_decay = history_decay
+        # search on a state that keeps the cheap evaluation terms up to date in make/ unmake_move
+        # (BitboardGameState(incremental=True)), so only the flood fill runs at the leaves
+        self.incremental_eval = incremental_eval
+        # static evaluations of the leaves, kept from one search to the next (0: no cache)
+        self.eval_cache = EvalCache(eval_cache_mb) if eval_cache_mb else None
+        # store symmetric positions under one canonical TT entry
+        self.use_symmetry = use_symmetry
         # current line of play
         self.tree_history = list()
 
-    def get_best_move(self, gs, game_history=None, time_limit=1.5):
-        self.game_state = gs.copy()
-        self.game_history = game_history
-
-        # Time Management
-        self.start_time = time.time()
-        self.time_limit = time_limit
-
-        self.killers.clear()
-        self.history.clear()
-        self.tt.clear()
-        self.tree_history.clear()
-
-        self.no_of_nodes = 0
-
-        # We reset the ply as well because our iterative deepening loop will terminate mid search,
-        # so for new position we must reset the ply as well.
-        self.ply = 0
+        if root_workers:
+            # start (and warm up) the workers now, not inside the first move's time budget
+            from parallel import start_root_pool
+            self.root_pool = start_root_pool(self)
 
-        alpha = float('-inf')
-        beta = float('inf')
+    def get_best_move(self, gs, game_history=None, time_limit=1.5, max_depth=99, start_depth=1, node_limit=None,
+                      return_stats=False):
+        """
+        time_limit is the hard limit in seconds, node_limit an optional one in nodes (see TimeManager).
+        return_stats: return (move, SearchStats) instead of the move. The stats of the last search
+        are kept in self.stats either way.
+        """
+        if self.root_workers:
+            from parallel import root_split_search
+            start = time.time()
+            best_move = root_split_search(self, gs, game_history, time_limit, max_depth, node_limit)
+            # per depth stats are only collected by a search in this process
+            elapsed = time.time() - start
+            self.stats = SearchStats(best_move, self.score, self.depth_times[-1][0] if self.depth_times else 0,
+                                     self.no_of_nodes, 0, elapsed, self.no_of_nodes / max(elapsed, 1e-9),
+                                     stop_reason=self.time_manager.stop_reason)
+            return (best_move, self.stats) if return_stats else best_move
+
+        self.new_search(gs, game_history, time_limit, node_limit)
+        self.stats = SearchStats()
+        # counters at the end of the previous iteration
+        prev = self._counters()
+        single_move = len(gs.get_legal_moves()) == 1
+
+        score = None
+        best_move = None
+        self.researches = 0
 
         # iterative deepening
-        for current_depth in range(1, 100):
+        for current_depth in range(start_depth, max_depth + 1):
 
-            root_pv = PV_Line()
+            # aspiration window: the score is expected to be close to the previous iteration's
+            window = self.window
+            if window and score is not None:
+                alpha, beta = score - window, score + window
+            else:
+                alpha, beta = float('-inf'), float('inf')
+            researches = 0
 
+            self.pv_table.follow(self.game_state)
             try:
-                score = self.negamax(alpha, beta, current_depth, root_pv)
-
-                best_move = root_pv[0]
-
-                elapsed_time = time.time() - self.start_time
+                while True:
+                    new_score = self.negamax(alpha, beta, current_depth)
+                    if alpha < new_score < beta:
+                        break
+                    # fail low/ high: widen the failed side and search again
+                    researches += 1
+                    window *= self.window_growth
+                    if new_score <= alpha:
+                        alpha = score - window if window < ASPIRATION_MAX else float('-inf')
+                    else:
+                        beta = score + window if window < ASPIRATION_MAX else float('inf')
+                score = new_score
+                self.score = score
+                self.researches += researches
+
+                # the search works with packed moves, the caller gets (src, dst)
+                root_pv = self.pv_table.line()
+                best_move = MOVE_TUPLE[root_pv[0]]
+                self.pv = [MOVE_TUPLE[move] for move in root_pv]
+
+                elapsed_time = self.time_manager.elapsed()
+                self.depth_times.append((current_depth, elapsed_time))
+                self.time_manager.iteration_done(current_depth, self.no_of_nodes, best_move)
+                prev = self._record_depth(current_depth, best_move, score, prev)
                 print(
-                    f" > Depth: {current_depth}. Best Move: {best_move}. No of Nodes: {self.no_of_nodes}. Score: {score:.2f}. Time: {elapsed_time:.2f}s.")
+                    f" > Depth: {current_depth}. Best Move: {best_move}. No of Nodes: {self.no_of_nodes}. QNodes: {self.no_of_qnodes}. Score: {score:.2f}. Re-searches: {researches}. Time: {elapsed_time:.2f}s.")
 
                 print(" > PV:", end=" ")
                 for move in root_pv:
-                    print(f"{move}", end=" ")
+                    print(f"{MOVE_TUPLE[move]}", end=" ")
                 print()
 
             except TimeoutError:
 
                 print(
                     f" > Timeout occurred at depth {current_depth}. No of Nodes: {self.no_of_nodes}.")
+                root_pv = self.pv_table.line()
+                if root_pv:
+                    # a move that beat alpha in the unfinished iteration is better than the previous best
+                    best_move = MOVE_TUPLE[root_pv[0]]
+                    self.pv = [MOVE_TUPLE[move] for move in root_pv]
+                    print(f" > Best Move of the unfinished depth: {best_move}.")
+                break
+
+            if current_depth < max_depth and not self.time_manager.next_iteration(single_move):
+                print(f" > Stopped after depth {current_depth}: {self.time_manager.stop_reason}.")
                 break
 
+        if best_move is None:
+            # not even the first iteration finished
+            best_move = gs.get_legal_moves()[0]
+
+        elapsed_time = self.time_manager.elapsed()
+        stats = self.stats
+        stats.best_move = best_move
+        stats.score = score
+        stats.depth = self.depth_times[-1][0] if self.depth_times else 0
+        stats.nodes = self.no_of_nodes
+        stats.qnodes = self.no_of_qnodes
+        stats.elapsed = elapsed_time
+        stats.nps = (self.no_of_nodes + self.no_of_qnodes) / max(elapsed_time, 1e-9)
+        stats.stop_reason = self.time_manager.stop_reason
+        stats.futility_prunes = self.futility_prunes
+        if self.eval_cache is not None:
+            stats.eval_hit_rate = self.eval_cache.hit_rate()
+
+        print(f" > TT: {self.tt.size_mb:.1f} MB, fill rate: {self.tt.fill_rate():.1%}, "
+              f"hit rate: {self.tt.hit_rate():.1%}.")
+        if self.eval_cache is not None:
+            print(f" > Eval cache: {self.eval_cache.size_mb:.1f} MB, fill rate: {self.eval_cache.fill_rate():.1%}, "
+                  f"hit rate: {self.eval_cache.hit_rate():.1%}.")
         print(f" > Final Best Move: {best_move}.\n")
-        return best_move
+        return (best_move, stats) if return_stats else best_move
+
+    def get_best_moves(self, gs, k=3, game_history=None, time_limit=1.5, max_depth=99, node_limit=None):
+        """
+        Multi-PV: the k best moves of gs from one search, as [(move, score, pv), ...] best first,
+        with (src, dst) moves and scores from the side to move's point of view.
+        Every iteration searches all root moves with one TT (see multipv_root), from the previous
+        iteration's ranking. A timeout keeps the ranking of the last completed iteration.
+        Always searches in this process, root_workers is ignored. [] if the game is over.
+        """
+        self.new_search(gs, game_history, time_limit, node_limit)
+        moves = gs.get_packed_moves()
+        if gs.is_game_over or not moves:
+            return []
+        # (score, move, pv) of every root move, the first k exact
+        ranking = []
+
+        for current_depth in range(1, max_depth + 1):
+            self.pv_table.follow(self.game_state, ranking[0][2] if ranking else None)
+            try:
+                results = self.multipv_root(current_depth, k, moves)
+            except TimeoutError:
+                print(f" > Timeout occurred at depth {current_depth}. No of Nodes: {self.no_of_nodes}.")
+                break
+
+            ranking = results
+            moves = [move for _, move, _ in ranking]
+            self.score = ranking[0][0]
+            self.pv = [MOVE_TUPLE[move] for move in ranking[0][2]]
 
-    def negamax(self, alpha, beta, depth, parent_pv: PV_Line):
+            elapsed_time = self.time_manager.elapsed()
+            self.depth_times.append((current_depth, elapsed_time))
+            self.time_manager.iteration_done(current_depth, self.no_of_nodes, MOVE_TUPLE[moves[0]])
+            print(f" > Depth: {current_depth}. Best Moves: "
+                  + ", ".join(f"{MOVE_TUPLE[move]} {score:.2f}" for score, move, _ in ranking[:k])
+                  + f". No of Nodes: {self.no_of_nodes}. Time: {elapsed_time:.2f}s.")
+
+            if current_depth < max_depth and not self.time_manager.next_iteration(len(moves) == 1):
+                print(f" > Stopped after depth {current_depth}: {self.time_manager.stop_reason}.")
+                break
+
+        if not ranking:
+            # not even the first iteration finished
+            return [(MOVE_TUPLE[move], None, [MOVE_TUPLE[move]]) for move in moves[:k]]
+        return [(MOVE_TUPLE[move], score, [MOVE_TUPLE[pv_move] for pv_move in pv])
+                for score, move, pv in ranking[:k]]
+
+    def multipv_root(self, depth, k, moves):
+        """
+        Searches the root moves to depth. Returns [(score, move, pv), ...] for all of them, best first
+        (ties in the order of moves). A move only gets an exact score if it beats the k-th best score
+        so far, the others get an upper bound.
+        """
+        state = self.game_state
+        if self.out_of_time():
+            raise TimeoutError()
+        self.no_of_nodes += 1
+        results = []
+        for move in moves:
+            # the k-th best so far, a null window search tells whether the move beats it
+            alpha = results[k - 1][0] if len(results) >= k else float('-inf')
+
+            state.make_move(move)
+            self.ply += 1
+            if state.key in self.game_history:
+                score = -(CONTEMPT * CONTEMPT)
+                pv = [move]
+            else:
+                self.tree_history.append(state.key)
+                if alpha == float('-inf'):
+                    score = -self.negamax(float('-inf'), float('inf'), depth - 1)
+                else:
+                    score = -self.negamax(-alpha - 1, -alpha, depth - 1)
+                    if score > alpha:
+                        score = -self.negamax(float('-inf'), -alpha, depth - 1)
+                self.tree_history.pop()
+                pv = [move] + self.pv_table.line(1)
+            self.ply -= 1
+            state.unmake_move()
+
+            position = len(results)
+            while position and results[position - 1][0] < score:
+                position -= 1
+            results.insert(position, (score, move, pv))
+        return results
+
+    def _counters(self):
+        eval_cache = self.eval_cache
+        return (self.no_of_nodes, self.no_of_qnodes, int(self.tt.stats[TT_PROBES]), int(self.tt.stats[TT_HITS]),
+                self.tt_cutoffs, eval_cache.probes if eval_cache else 0, eval_cache.hits if eval_cache else 0,
+                self.fail_highs, self.first_move_fail_highs, self.killer_fail_highs, self.history_fail_highs)
+
+    def _record_depth(self, depth, best_move, score, prev):
+        """Adds the DepthStats of the iteration that just completed, returns the counters for the next one."""
+        counters = self._counters()
+        (nodes, qnodes, tt_probes, tt_hits, tt_cutoffs, eval_probes, eval_hits, fail_highs,
+         first_move, killer, history) = (now - before for now, before in zip(counters, prev))
+        elapsed_time = self.time_manager.elapsed()
+        iteration_time = elapsed_time - (self.stats.depths[-1].elapsed if self.stats.depths else 0.0)
+        prev_nodes = self.stats.depths[-1].nodes if self.stats.depths else 0
+        self.stats.depths.append(DepthStats(
+            depth, best_move, score, nodes, qnodes, elapsed_time,
+            (nodes + qnodes) / max(iteration_time, 1e-9),
+            tt_probes, tt_hits, tt_cutoffs, eval_probes, eval_hits, fail_highs,
+            first_move / max(fail_highs, 1), killer / max(fail_highs, 1), history / max(fail_highs, 1),
+            nodes / prev_nodes if prev_nodes else None))
+        return counters
+
+    def new_search(self, gs, game_history, time_limit, node_limit=None):
+        self.reset_search(gs, game_history, time_limit, node_limit)
+
+        # once per move: age the TT and the history heuristic (or start over)
+        if self.keep_tt:
+            self.tt.new_search()
+            self.decay_history()
+        else:
+            self.history.fill(0)
+            self.tt.clear()
+        if self.eval_cache is not None:
+            self.eval_cache.new_search()
+
+    def reset_search(self, gs, game_history, time_limit, node_limit=None):
+        """
+        The part of new_search that is per search rather than per move: the position, the clock,
+        the killers and the counters. The TT and the history are left as they are, so a root split
+        worker (see parallel.py) can search several tasks of the same move.
+        """
+        self.game_state = gs.copy(incremental=self.incremental_eval)
+        self.game_history = game_history if game_history is not None else ()
+
+        # Time Management
+        self.time_manager = TimeManager(time_limit, node_limit, self.soft_time_ratio, self.stop_event)
+
+        self.killers.fill(TT_NO_MOVE)
+        self.tree_history.clear()
+        self.pv = []
+        self.pv_table.clear()
+        # (depth, seconds from the start of the search) of every completed iteration
+        self.depth_times = []
+
+        self.no_of_nodes = 0
+        self.no_of_qnodes = 0
+        self.tt_cutoffs = 0
+        self.futility_prunes = 0
+        self.repetitions = 0
+        self.fail_highs = 0
+        self.first_move_fail_highs = 0
+        self.killer_fail_highs = 0
+        self.history_fail_highs = 0
+
+        # We reset the ply as well because our iterative deepening loop will terminate mid search,
+        # so for new position we must reset the ply as well.
+        self.ply = 0
+
+    def expected_reply(self):
+        """The opponent's reply to the best move in the PV of the last search, None if the PV ends there."""
+        return self.pv[1] if len(self.pv) > 1 else None
+
+    def close(self):
+        if self.root_pool is not None:
+            self.root_pool.shutdown()
+            self.root_pool = None
+
+    def negamax(self, alpha, beta, depth, allow_null=True):
 
         if self.no_of_nodes & 1023 == 0:
-            if time.time() - self.start_time > self.time_limit:
+            if self.out_of_time():
                 raise TimeoutError()
 
         self.no_of_nodes += 1
 
         # init PV length
-        node_pv = PV_Line()
+        self.pv_table.init_node(self.ply)
 
-        state_key = self.game_state.key
-        val, tt_move = self.tt.get(state_key, depth, alpha, beta)
-        if val is not None:
+        if self.use_symmetry:
+            state_key, sym = canonical_key(self.game_state)
+        else:
+            state_key, sym = self.game_state.key, 0
+
+        val, tt_move, repetition = self.tt.get(state_key, depth, alpha, beta, self.ply)
+        # no cutoff at the root, it has to fill in the PV. (only an entry kept from
+        # an earlier move can be deep enough there)
+        if val is not None and self.ply:
+            self.tt_cutoffs += 1
+            if repetition:
+                self.repetitions += 1
+            return val
+        # any repetition score found below this node makes its entry path dependent
+        repetitions = self.repetitions
+        if tt_move is not None and sym:
+            # the entry's move is stored in the canonical orientation
+            tt_move = transform_move(tt_move, SYM_INVERSE[sym])
+
+        if depth == 0 and self.use_qsearch and not self.game_state.is_game_over and self.ply <= MAX_PLY - 1:
+            val = self.qsearch(alpha, beta)
+            # qsearch is fail-hard, so the result is only exact inside the window
+            if val <= alpha:
+                flag = ALPHA_FLAG
+            elif val >= beta:
+                flag = BETA_FLAG
+            else:
+                flag = EXACT_FLAG
+            self.tt_put(state_key, sym, depth, val, flag, None)
             return val
 
         if depth == 0 or self.game_state.is_game_over or (self.ply > MAX_PLY - 1):
             val = self.evaluate()
-            entry = TTEntry(state_key, depth, val, EXACT_FLAG, None)
-            self.tt.put(entry)
+            self.tt_put(state_key, sym, depth, val, EXACT_FLAG, None)
             return val
 
-        moves = self.game_state.get_legal_moves()
+        # null window nodes only, the PV is always searched in full
+        pv_node = beta - alpha > 1
+        turn = self.game_state.turn
+        static_eval = None
+
+        if pv_node:
+            # the PV of the previous iteration first, even if its TT entry has been replaced
+            pv_move = self.pv_table.pv_move(self.ply, self.game_state.key)
+            if pv_move != TT_NO_MOVE:
+                tt_move = pv_move
+
+        if (self.use_null_move and allow_null and not pv_node and self.ply and turn == Piece_TIGER
+                and depth >= NULL_MOVE_MIN_DEPTH and abs(beta) < MATE_BOUND
+                and self.game_state.trapped_tiger_count < NULL_MOVE_MAX_TRAPPED):
+            static_eval = self.evaluate()
+            if static_eval >= beta:
+                self.game_state.make_null_move()
+                self.ply += 1
+                score = -self.negamax(-beta, -beta + 1, depth - 1 - NULL_MOVE_R)
+                self.ply -= 1
+                self.game_state.unmake_null_move()
+                if score >= beta:
+                    # verification
+                    score = self.negamax(beta - 1, beta, depth - NULL_MOVE_R, allow_null=False)
+                    if score >= beta:
+                        self.tt_put(state_key, sym, depth, beta, BETA_FLAG, None,
+                                    self.repetitions != repetitions)
+                        return beta
+
+        futile = False
+        if (self.use_futility and not pv_node and self.ply and depth <= FUTILITY_DEPTH
+                and abs(alpha) < MATE_BOUND
+                # a goat move that traps the last tiger is quiet too
+                and not (turn == Piece_GOAT and self.game_state.trapped_tiger_count >= 3)):
+            if static_eval is None:
+                static_eval = self.evaluate()
+            margin = depth * FUTILITY_MARGIN
+            if turn == Piece_GOAT and self.game_state.goats_to_place and not self.game_state.goats_eaten:
+                margin += FUTILITY_PLACEMENT
+            futile = static_eval + margin <= alpha
+
+        # goat 0, tiger 1
+        side = (turn + 1) // 2
+        killers = self.killers[self.ply, side]
+        killer1, killer2 = int(killers[0]), int(killers[1])
+
+        # score every move once, then pick them best first
+        moves = self.move_stack[self.ply]
+        scores = self.score_stack[self.ply]
+        n = self.game_state.generate_packed_moves(moves)
+        score_moves(self.game_state.tigers_bb, self.game_state.goats_bb, turn, moves, n,
+                    TT_NO_MOVE if tt_move is None else tt_move, killer1, killer2, self.history[side], scores,
+                    MOVE_SRC_NP, MOVE_DST_NP, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP,
+                    OUTER_EDGE_MASK, STRATEGIC_MASK)
 
         hash_flag = ALPHA_FLAG
         best_move = None
 
         found_pv = False
 
-        for i in range(len(moves)):
+        for i in range(n):
 
-            self.pick_move(moves, i, tt_move)
+            move = pick_next(moves, scores, i, n)
 
-            move = moves[i]
+            reduction = 0
+            if ((futile or self.use_lmr) and i and move != tt_move and move != killer1 and move != killer2
+                    and self.game_state.is_quiet(move)):
+                if futile:
+                    self.futility_prunes += 1
+                    continue
+                if self.use_lmr and depth >= self.lmr_min_depth and i >= self.lmr_min_moves:
+                    reduction = min(1 if i < LMR_LATE_MOVES else 2, depth - 2)
 
             self.game_state.make_move(move)
             self.ply += 1
@@ -170,18 +944,25 @@ class AlphaBetaAgent():
                         self.game_state.key in self.game_history)
             if repeated:
                 score = -(CONTEMPT * CONTEMPT)  # ALMOST NEVER REPEATS A MOVE
+                self.repetitions += 1
+                # not searched, its line ends here
+                self.pv_table.init_node(self.ply)
             else:
                 self.tree_history.append(self.game_state.key)
 
-                if found_pv:
-                    score = -self.negamax(-alpha - 1, -
-                                          alpha, depth - 1, node_pv)
-                    if alpha < score < beta:  # check for failure
-                        # another node is actually the PV node!
-                        score = -self.negamax(-beta, -
-                                              alpha, depth - 1, node_pv)
-                else:
-                    score = -self.negamax(-beta, -alpha, depth - 1, node_pv)
+                if reduction:
+                    score = -self.negamax(-alpha - 1, -alpha, depth - 1 - reduction)
+                if not reduction or score > alpha:
+                    # not reduced, or the reduced search beat alpha: full depth
+                    if found_pv:
+                        score = -self.negamax(-alpha - 1, -
+                                              alpha, depth - 1)
+                        if alpha < score < beta:  # check for failure
+                            # another node is actually the PV node!
+                            score = -self.negamax(-beta, -
+                                                  alpha, depth - 1)
+                    else:
+                        score = -self.negamax(-beta, -alpha, depth - 1)
 
                 self.tree_history.pop()
 
@@ -191,20 +972,23 @@ class AlphaBetaAgent():
             # fail-hard beta cutoff
             if score >= beta:
 
-                if self.is_quiet(move):
-                    killer_key = (self.ply, self.game_state.turn)
-                    killers = self.killers.get(killer_key, [None, None])
+                self.fail_highs += 1
+                if i == 0:
+                    self.first_move_fail_highs += 1
+                if move == tt_move:
+                    pass
+                elif move == killer1 or move == killer2:
+                    self.killer_fail_highs += 1
+                elif self.is_quiet(move) and self.history[side, MOVE_DST[move]]:
+                    self.history_fail_highs += 1
 
+                if self.is_quiet(move):
                     killers[1] = killers[0]
                     killers[0] = move
 
-                    self.killers[killer_key] = killers
-
-                    history_key = (self.game_state.turn, move[1])
-                    self.history[history_key] += depth
+                    self.history[side, MOVE_DST[move]] += depth
 
-                entry = TTEntry(state_key, depth, beta, BETA_FLAG, move)
-                self.tt.put(entry)
+                self.tt_put(state_key, sym, depth, beta, BETA_FLAG, move, self.repetitions != repetitions)
 
                 # node (move) fails high
                 return beta
@@ -221,58 +1005,74 @@ class AlphaBetaAgent():
                 hash_flag = EXACT_FLAG
 
                 # update PV table
-                parent_pv.clear()
-                parent_pv.append(move)
-                parent_pv.extend(node_pv)
+                self.pv_table.update(self.ply, move)
 
         # For testing the effectiveness of move ordering
         # if self.ply == 0:
         #     print(moves)
 
         # node (move) fails low i.e. score <= alpha
-        entry = TTEntry(state_key, depth, alpha, hash_flag, best_move)
-        self.tt.put(entry)
+        self.tt_put(state_key, sym, depth, alpha, hash_flag, best_move, self.repetitions != repetitions)
 
         return alpha
 
+    def out_of_time(self):
+        return self.time_manager.out_of_time(self.no_of_nodes)
+
+    def qsearch(self, alpha, beta):
+        """
+        Only tigers can capture, so only tiger nodes search further (captures only).
+        Goat nodes stand pat: goat is assumed to have a move that is no worse than the static evaluation.
+        """
+        if self.no_of_qnodes & 1023 == 0:
+            if self.out_of_time():
+                raise TimeoutError()
+
+        self.no_of_qnodes += 1
+
+        stand_pat = self.evaluate()
+        if self.game_state.is_game_over or self.ply > MAX_PLY - 1:
+            return stand_pat
+
+        if stand_pat >= beta:
+            return beta
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        if self.game_state.turn == Piece_GOAT:
+            return alpha
+
+        # delta pruning: not even the best possible capture gets us back up to alpha
+        delta = QS_DELTA_FIRST_CAPTURE if self.game_state.goats_eaten == 0 else QS_DELTA
+        if stand_pat + delta < alpha:
+            return alpha
+
+        for move in self.game_state.get_packed_moves(only_captures=True):
+            self.game_state.make_move(move)
+            self.ply += 1
+            score = -self.qsearch(-beta, -alpha)
+            self.ply -= 1
+            self.game_state.unmake_move()
+
+            if score >= beta:
+                return beta
+            if score > alpha:
+                alpha = score
+
+        return alpha
+
+    def decay_history(self):
+        self.history[:] = self.history * self.history_decay
+
+    def tt_put(self, state_key, sym, depth, evaluation, flag, best_move, repetition=False):
+        if best_move is not None and sym:
+            best_move = transform_move(best_move, sym)
+        self.tt.put(state_key, depth, evaluation, flag, best_move, self.ply, repetition)
+
     def is_quiet(self, move):
         if self.game_state.turn == Piece_GOAT:
             return True
-        src, dst = move
-        # if src and dst are adjacent, then the move is a non-capture
-        return MOVE_MASKS[src] & (1 << dst) != 0
-
-    def pick_move(self, moves, current_idx, tt_move):
-        best_score = float('-inf')
-        best_idx = current_idx
-
-        killer_key = (self.ply, self.game_state.turn)
-        killer1, killer2 = self.killers.get(killer_key, [None, None])
-        for j, move in enumerate(moves[current_idx:len(moves)]):
-            score = self._score_move(move)
-
-            if move == tt_move:
-                score += 5000
-            elif move == killer1:
-                score += 1000
-            elif move == killer2:
-                score += 900
-            elif self.is_quiet(move):
-                history_key = (self.game_state.turn, move[1])
-                history_heuristic = self.history[history_key]
-                score += history_heuristic
-
-            if score > best_score:
-                best_score = score
-                best_idx = j + current_idx  # offset
-
-        moves[current_idx], moves[best_idx] = moves[best_idx], moves[current_idx]
-
-    def _score_move(self, move):
-        if self.game_state.turn == Piece_TIGER:
-            return tiger_priority(self.game_state.tigers_bb, self.game_state.goats_bb, move, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
-        else:
-            return goat_priority(self.game_state.tigers_bb, self.game_state.goats_bb, move, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP, OUTER_EDGE_MASK, STRATEGIC_MASK)
+        return not move & MOVE_CAPTURE_FLAG
 
     def evaluate(self):
         """
@@ -298,6 +1098,11 @@ class AlphaBetaAgent():
             score = 2000 - self.ply
             return score * result * state.turn
 
+        if self.eval_cache is not None:
+            cached = self.eval_cache.get(state.key)
+            if cached is not None:
+                return cached * state.turn
+
         trapped = state.trapped_tiger_count
         eaten = state.goats_eaten
         goat_left = state.goats_to_place
@@ -305,7 +1110,7 @@ class AlphaBetaAgent():
 
         eaten_score = eaten / eat_max
 
-        potential_captures = self._count_potential_captures()
+        potential_captures = state.potential_captures
         potential_capture_score = potential_captures / potential_capture_max
         potential_capture_score = min(1, potential_capture_score)
 
@@ -331,22 +1136,10 @@ class AlphaBetaAgent():
             goat_score += 300
 
         final_evaluation = tiger_score - goat_score
+        if self.eval_cache is not None:
+            self.eval_cache.put(state.key, final_evaluation)
         return final_evaluation * state.turn
 
-    def _count_potential_captures(self):
-
-        occupied_bb = self.game_state.tigers_bb | self.game_state.goats_bb
-        empty_bb = ~occupied_bb & BOARD_MASK
-
-        capture_opportunities = 0
-
-        for tiger in extract_indices_fast(self.game_state.tigers_bb):
-            for mid_mask, land_mask in CAPTURE_MASKS[tiger]:
-                if (self.game_state.goats_bb & mid_mask) and (empty_bb & land_mask):
-                    capture_opportunities += 1
-
-        return capture_opportunities
-
     def _get_tiger_accessibility(self):
         accessible, inaccessible = tiger_board_accessibility(
             self.game_state.tigers_bb, self.game_state.goats_bb,
@@ -1,6 +1,7 @@
 import time
 from collections import defaultdict
 from bagchal import *
+from negamax import PVTable, TT_NO_MOVE
 
 EXACT_FLAG, ALPHA_FLAG, BETA_FLAG = 0, 1, 2
 MAX_PLY = 64
@@ -68,10 +69,8 @@ class AlphaBetaAgent():
         self.killers = {}
         # (square, turn) -> no of cutoffs
         self.history = defaultdict(int)
-        # ply -> length of the pv at that ply
-        self.pv_length = {}
-        # (ply, ply) -> expected line of play
-        self.pv_table = {}
+        # expected line of play, as packed moves
+        self.pv_table = PVTable(MAX_PLY)
         # transposition table
         self.tt = TT()
 
@@ -79,10 +78,6 @@ class AlphaBetaAgent():
         self.game_state = gs.copy()
         self.game_history = game_history
 
-        # PV Sorting
-        self.follow_pv = False
-        self.score_pv = False
-
         # Time Management
         self.start_time = time.time()
         self.time_limit = time_limit
@@ -91,7 +86,6 @@ class AlphaBetaAgent():
         self.history.clear()
         self.tt.clear()
 
-        self.pv_length.clear()
         self.pv_table.clear()
         self.no_of_nodes = 0
 
@@ -105,18 +99,20 @@ class AlphaBetaAgent():
 
         # iterative deepening
         for current_depth in range(1, depth+1):
-            self.follow_pv = True
+            # PV Sorting
+            self.pv_table.follow(self.game_state)
             try:
                 score = self.negamax(alpha, beta, current_depth)
 
-                best_move = self.pv_table[(0, 0)]
+                pv = [MOVE_TUPLE[move] for move in self.pv_table.line()]
+                best_move = pv[0]
 
                 elapsed_time = time.time() - self.start_time
                 print(
                     f" > Depth: {current_depth}. Best Move: {best_move}. No of Nodes: {self.no_of_nodes}. Score: {score:.2f}. Time: {elapsed_time:.2f}s.")
                 print(" > PV:", end=" ")
-                for i in range(self.pv_length[0]):
-                    print(f"{self.pv_table[(0, i)]}", end=" ")
+                for move in pv:
+                    print(f"{move}", end=" ")
                 print()
 
             except TimeoutError:
@@ -137,7 +133,7 @@ class AlphaBetaAgent():
         self.no_of_nodes += 1
 
         # init PV length
-        self.pv_length[self.ply] = self.ply
+        self.pv_table.init_node(self.ply)
 
         state_key = self.game_state.key
         val, tt_move = self.tt.get(state_key, depth, alpha, beta)
@@ -157,18 +153,13 @@ class AlphaBetaAgent():
 
         found_pv = False
 
-        if self.follow_pv:
-            self.follow_pv = False
-            for move in moves:
-                pv_move = self.pv_table.get((0, self.ply), None)
-                if pv_move == move:
-                    self.score_pv = True
-                    self.follow_pv = True
-                    break
+        # the move of the previous iteration's PV, if this node is on it
+        pv_move = self.pv_table.pv_move(self.ply, state_key)
+        pv_move = None if pv_move == TT_NO_MOVE else MOVE_TUPLE[pv_move]
 
         for i in range(len(moves)):
 
-            self.pick_move(moves, i, tt_move)
+            self.pick_move(moves, i, tt_move, pv_move)
 
             move = moves[i]
 
@@ -219,12 +210,7 @@ class AlphaBetaAgent():
                 hash_flag = EXACT_FLAG
 
                 # update PV table
-                self.pv_table[(self.ply, self.ply)] = move
-                for next_ply in range(self.ply + 1, self.pv_length[self.ply + 1]):
-                    self.pv_table[(self.ply, next_ply)
-                                  ] = self.pv_table[(self.ply + 1, next_ply)]
-
-                self.pv_length[self.ply] = self.pv_length[self.ply + 1]
+                self.pv_table.update(self.ply, pack_move(move))
 
         # For testing the effectiveness of move ordering
         # if self.ply == 0:
@@ -243,7 +229,7 @@ class AlphaBetaAgent():
         # if src and dst are adjacent, then the move is a non-capture
         return MOVE_MASKS[src] & (1 << dst) != 0
 
-    def pick_move(self, moves, current_idx, tt_move):
+    def pick_move(self, moves, current_idx, tt_move, pv_move):
         best_score = float('-inf')
         best_idx = current_idx
 
@@ -252,13 +238,9 @@ class AlphaBetaAgent():
         for j, move in enumerate(moves[current_idx:len(moves)]):
             score = self._score_move(move)
 
-            if self.score_pv:
-                pv_move = self.pv_table.get((0, self.ply), None)
-                if pv_move == move:
-                    # We always wanna try the PV move first!
-                    score += 5000
-                    self.score_pv = False
-                    # print(f"Current PV Move: {pv_move}. Ply: {self.ply}")
+            if move == pv_move:
+                # We always wanna try the PV move first!
+                score += 5000
             else:
                 if move == tt_move:
                     score += 2500
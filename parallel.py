@@ -0,0 +1,312 @@
+import contextlib
+import io
+import multiprocessing as mp
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from bagchal import *
+from negamax import AlphaBetaAgent, TimeManager, TimeoutError, TT, TT_WAYS, TT_SLOT_WORDS, tt_buckets, CONTEMPT
+
+# Lazy SMP
+# N worker processes search the same root at the same time and share one transposition
+# table in shared memory. The workers don't coordinate beyond that: each one runs its own
+# iterative deepening (odd workers start one depth deeper so they don't all walk the same
+# tree in lockstep) and they speed each other up through the entries they write to the table.
+# The deepest completed iteration of any worker is played.
+#
+# processes rather than threads since the search is python code and holds the GIL.
+# the table needs no lock, see the key ^ data ^ score check in negamax.tt_probe.
+
+
+def _worker_main(worker_id, shm_name, n_buckets, tasks, results, stop_event, agent_kwargs):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    table = np.ndarray((n_buckets, TT_WAYS, TT_SLOT_WORDS), dtype=np.int64, buffer=shm.buf)
+
+    # load the compiled kernels before the first timed search, with an agent of its own so the
+    # shared table stays empty. start() waits for every worker to report ready
+    with contextlib.redirect_stdout(io.StringIO()):
+        AlphaBetaAgent(tt_size_mb=1, **agent_kwargs).get_best_move(
+            BitboardGameState(), game_history=[], time_limit=float('inf'), max_depth=2)
+    results.put((worker_id, "ready"))
+
+    # the shared table is never cleared by a worker: every task starts a new generation instead
+    agent = AlphaBetaAgent(keep_tt=True, **agent_kwargs)
+    agent.tt = TT(table=table)
+    agent.stop_event = stop_event
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            position, game_history, time_limit, max_depth = task
+            with contextlib.redirect_stdout(io.StringIO()):
+                move = agent.get_best_move(BitboardGameState(*position), game_history=game_history,
+                                           time_limit=time_limit, max_depth=max_depth,
+                                           start_depth=1 + worker_id % 2)
+            depth = agent.depth_times[-1][0] if agent.depth_times else 0
+            results.put((worker_id, depth, move, agent.score, agent.no_of_nodes))
+    finally:
+        del table
+        shm.close()
+
+
+class LazySMPAgent:
+    """
+    Same get_best_move interface as AlphaBetaAgent.
+    The worker processes are started on the first search (or by start(), to keep the jit
+    warm up out of the first move) and kept until close().
+    """
+
+    def __init__(self, workers=4, tt_size_mb=64, **agent_kwargs):
+        self.n_workers = workers
+        self.tt_size_mb = tt_size_mb
+        self.agent_kwargs = agent_kwargs
+        self.processes = []
+        self.shm = None
+        self.no_of_nodes = 0
+        self.depth = 0
+
+    def start(self):
+        if self.processes:
+            return
+        # spawn: forking a process that already runs the GUI's threads isn't safe
+        ctx = mp.get_context("spawn")
+        n_buckets = tt_buckets(self.tt_size_mb)
+        self.shm = shared_memory.SharedMemory(create=True, size=n_buckets * TT_WAYS * TT_SLOT_WORDS * 8)
+        self.table = np.ndarray((n_buckets, TT_WAYS, TT_SLOT_WORDS), dtype=np.int64, buffer=self.shm.buf)
+        self.table.fill(0)
+        self.tasks = [ctx.Queue() for _ in range(self.n_workers)]
+        self.results = ctx.Queue()
+        self.stop_event = ctx.Event()
+        for worker_id in range(self.n_workers):
+            process = ctx.Process(target=_worker_main, daemon=True,
+                                  args=(worker_id, self.shm.name, n_buckets, self.tasks[worker_id],
+                                        self.results, self.stop_event, self.agent_kwargs))
+            process.start()
+            self.processes.append(process)
+        for _ in range(self.n_workers):
+            self._get_result()
+
+    def _get_result(self):
+        while True:
+            try:
+                return self.results.get(timeout=1.0)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise RuntimeError("a lazy smp worker died")
+
+    def clear_tt(self):
+        if self.shm is not None:
+            self.table.fill(0)
+
+    def get_best_move(self, gs, game_history=None, time_limit=1.5, max_depth=99):
+        self.start()
+        self.stop_event.clear()
+
+        position = (gs.tigers_bb, gs.goats_bb, gs.turn, gs.goats_to_place, gs.goats_eaten)
+        game_history = set(game_history) if game_history is not None else set()
+        for tasks in self.tasks:
+            tasks.put((position, game_history, time_limit, max_depth))
+
+        # the deepest iteration wins, ties go to the lower worker id
+        best = None
+        self.no_of_nodes = 0
+        for _ in range(self.n_workers):
+            worker_id, depth, move, score, nodes = self._get_result()
+            if depth >= max_depth:
+                # one worker got there, the others can stop
+                self.stop_event.set()
+            self.no_of_nodes += nodes
+            if best is None or (depth, -worker_id) > (best[1], -best[0]):
+                best = (worker_id, depth, move, score)
+
+        worker_id, self.depth, best_move, score = best
+        print(f" > Lazy SMP: {self.n_workers} workers. Depth: {self.depth} (worker {worker_id}). "
+              f"Best Move: {best_move}. No of Nodes: {self.no_of_nodes}.")
+        return best_move
+
+    def close(self):
+        for tasks in self.tasks if self.processes else []:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+        if self.shm is not None:
+            del self.table
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Root splitting
+# AlphaBetaAgent(root_workers=n): every iteration of the iterative deepening the root moves are
+# dealt out to a persistent pool of n processes, best moves of the previous iteration first,
+# so each worker gets a share of the likely good moves. Each worker searches its moves with its
+# own agent (and TT) and a window starting at the previous iteration's score minus
+# ROOT_SPLIT_WINDOW. If every move fails low the iteration is searched again with a full window.
+ROOT_SPLIT_WINDOW = 50
+
+# the agent of a pool worker process, created by the pool initializer
+_root_agent = None
+# the parent's search (AlphaBetaAgent.root_searches) the worker's TT and history were last aged for
+_root_search_id = None
+
+
+def _init_root_worker(agent_kwargs):
+    global _root_agent
+    _root_agent = AlphaBetaAgent(keep_tt=True, **agent_kwargs)
+    # load the compiled kernels now rather than in the first timed search
+    with contextlib.redirect_stdout(io.StringIO()):
+        _root_agent.get_best_move(BitboardGameState(), game_history=[], time_limit=float('inf'), max_depth=2)
+
+
+def _search_root_moves(position, game_history, moves, depth, alpha, beta, deadline, search_id, node_limit=None):
+    """
+    Searches the given root moves to depth. Returns ([(move, score, pv), ...], nodes, finished),
+    finished is False if the deadline (or node_limit, this task's share of the nodes) was reached first.
+    """
+    global _root_search_id
+    agent = _root_agent
+    if search_id != _root_search_id:
+        # first task of this move: the TT and the history are aged once per move
+        agent.new_search(BitboardGameState(*position), game_history, deadline - time.time(), node_limit)
+        _root_search_id = search_id
+    else:
+        agent.reset_search(BitboardGameState(*position), game_history, deadline - time.time(), node_limit)
+    state = agent.game_state
+    results = []
+    try:
+        for move in moves:
+            state.make_move(move)
+            agent.ply += 1
+            if state.key in game_history:
+                score = -(CONTEMPT * CONTEMPT)
+                pv = [move]
+            else:
+                agent.tree_history.append(state.key)
+                score = -agent.negamax(-beta, -alpha, depth - 1)
+                agent.tree_history.pop()
+                pv = [move] + agent.pv_table.line(1)
+            agent.ply -= 1
+            state.unmake_move()
+
+            results.append((move, score, pv))
+            if score > alpha:
+                alpha = score
+    except TimeoutError:
+        return results, agent.no_of_nodes, False
+    return results, agent.no_of_nodes, True
+
+
+def start_root_pool(agent: AlphaBetaAgent):
+    """The pool of agent.root_workers processes, started and warmed up. Called by AlphaBetaAgent()."""
+    n_workers = agent.root_workers
+    agent_kwargs = dict(use_symmetry=agent.use_symmetry, use_qsearch=agent.use_qsearch,
+                        tt_size_mb=agent.tt.size_mb,
+                        eval_cache_mb=agent.eval_cache.size_mb if agent.eval_cache is not None else 0)
+    pool = ProcessPoolExecutor(n_workers, mp_context=mp.get_context("spawn"),
+                               initializer=_init_root_worker, initargs=(agent_kwargs,))
+    # the workers are started on demand: get them all up now
+    for future in [pool.submit(time.sleep, 0.05) for _ in range(n_workers)]:
+        future.result()
+    return pool
+
+
+def root_split_search(agent: AlphaBetaAgent, gs, game_history, time_limit, max_depth, node_limit=None):
+    """
+    AlphaBetaAgent.get_best_move for root_workers > 0. None if there is no legal move.
+    Iterations are started and stopped by the agent's TimeManager as in get_best_move, node_limit
+    counts the nodes of all the workers together.
+    """
+    n_workers = agent.root_workers
+    if agent.root_pool is None:
+        # after close()
+        agent.root_pool = start_root_pool(agent)
+    agent.root_searches += 1
+
+    time_manager = agent.time_manager = TimeManager(time_limit, node_limit, agent.soft_time_ratio, agent.stop_event)
+    deadline = time_manager.start_time + time_limit
+    position = (gs.tigers_bb, gs.goats_bb, gs.turn, gs.goats_to_place, gs.goats_eaten)
+    game_history = set(game_history) if game_history is not None else set()
+
+    agent.depth_times = []
+    agent.no_of_nodes = 0
+    agent.score = None
+    agent.pv = []
+    moves = gs.get_packed_moves()
+    best_move = None
+    if not moves:
+        print(" > No legal moves.\n")
+        return None
+
+    single_move = len(moves) == 1
+
+    for depth in range(1, max_depth + 1):
+        alpha = float('-inf') if agent.score is None else agent.score - ROOT_SPLIT_WINDOW
+        while True:
+            results = []
+            finished = not time_manager.out_of_time(agent.no_of_nodes)
+            if not finished:
+                break
+            n_tasks = min(n_workers, len(moves))
+            # every task gets an equal share of the nodes left, so together they stay within node_limit
+            task_nodes = None if node_limit is None else max((node_limit - agent.no_of_nodes) // n_tasks, 1)
+            futures = [agent.root_pool.submit(_search_root_moves, position, game_history, moves[i::n_workers],
+                                              depth, alpha, float('inf'), deadline, agent.root_searches,
+                                              task_nodes)
+                       for i in range(n_tasks)]
+            for future in futures:
+                worker_results, nodes, worker_finished = future.result()
+                results.extend(worker_results)
+                agent.no_of_nodes += nodes
+                finished &= worker_finished
+            if not finished:
+                break
+            best_score = max(score for _, score, _ in results)
+            if best_score > alpha or alpha == float('-inf'):
+                break
+            # everything failed low
+            alpha = float('-inf')
+
+        if not finished:
+            print(f" > Timeout occurred at depth {depth}. No of Nodes: {agent.no_of_nodes}.")
+            # as in get_best_move: a move of the unfinished iteration that beat the previous best is better
+            if results:
+                move, score, pv = max(results, key=lambda result: result[1])
+                if agent.score is None or score > agent.score:
+                    best_move = move
+                    agent.pv = [MOVE_TUPLE[pv_move] for pv_move in pv]
+                    print(f" > Best Move of the unfinished depth: {MOVE_TUPLE[best_move]}.")
+            break
+
+        # next iteration: best moves first, ties in the previous order
+        order = {move: i for i, move in enumerate(moves)}
+        results.sort(key=lambda result: (-result[1], order[result[0]]))
+        moves = [move for move, _, _ in results]
+        best_move, agent.score, pv = results[0]
+        agent.pv = [MOVE_TUPLE[move] for move in pv]
+
+        elapsed_time = time_manager.elapsed()
+        agent.depth_times.append((depth, elapsed_time))
+        time_manager.iteration_done(depth, agent.no_of_nodes, best_move)
+        print(f" > Depth: {depth}. Best Move: {MOVE_TUPLE[best_move]}. No of Nodes: {agent.no_of_nodes}. "
+              f"Score: {agent.score:.2f}. Workers: {n_workers}. Time: {elapsed_time:.2f}s.")
+        print(" > PV:", " ".join(str(MOVE_TUPLE[move]) for move in pv))
+
+        if depth < max_depth and not time_manager.next_iteration(single_move):
+            print(f" > Stopped after depth {depth}: {time_manager.stop_reason}.")
+            break
+
+    if best_move is None:
+        best_move = moves[0]
+    print(f" > Final Best Move: {MOVE_TUPLE[best_move]}.\n")
+    return MOVE_TUPLE[best_move]
@@ -0,0 +1,219 @@
+import sys
+import time
+from numba import njit, prange
+import numba
+import numpy as np
+from bagchal import *
+from positions import BENCHMARK_POSITIONS, make_position
+from compiled_state import perft_compiled_state, check_equivalence
+
+# perft: counts the leaf nodes of the full game tree up to a fixed depth.
+# It's the standard way to measure raw move generation speed and to check a
+# new move generator against the old one: both must produce the same counts.
+# Positions where the game is over are not expanded.
+
+# name -> node counts for depth 1, 2, 3, ...
+# generated with the python perft below from BitboardGameState
+PERFT_REFERENCE = {
+    "start": [21, 252, 5052, 68204, 1304788],
+    "late_placement": [17, 320, 5200, 91333, 1444506],
+    "interesting_1": [10, 77, 698, 5803, 47445, 384635],
+    "interesting_2": [7, 51, 315, 2036, 10935, 63317, 293475],
+    "interesting_3": [11, 96, 966, 8127, 74490, 626826],
+    "scratch": [12, 168, 2224, 29056, 387484],
+}
+
+
+def perft(state: BitboardGameState, depth):
+    if depth == 0:
+        return 1
+    if state.is_game_over:
+        return 0
+
+    nodes = 0
+    for move in state.get_legal_moves():
+        state.make_move(move)
+        nodes += perft(state, depth - 1)
+        state.unmake_move()
+    return nodes
+
+
+def divide(state: BitboardGameState, depth):
+    """Per root move perft counts, for narrowing down which subtree a mismatch is in."""
+    counts = {}
+    if depth == 0 or state.is_game_over:
+        return counts
+    for move in state.get_legal_moves():
+        state.make_move(move)
+        counts[move] = perft(state, depth - 1)
+        state.unmake_move()
+    return counts
+
+
+# Compiled perft
+# works directly on the bitboards, so the whole tree is walked without leaving native code
+
+
+@njit(cache=True)
+def apply_move(tigers_bb, goats_bb, turn, goats_to_place, goats_eaten, src, dst, MOVE_MASKS):
+    # same rules as BitboardGameState.make_move, minus the hashing and the history
+    if turn == Piece_GOAT and goats_to_place > 0:
+        goats_bb |= (1 << dst)
+        goats_to_place -= 1
+    elif MOVE_MASKS[src] & (1 << dst):
+        move_mask = (1 << src) | (1 << dst)
+        if turn == Piece_TIGER:
+            tigers_bb ^= move_mask
+        else:
+            goats_bb ^= move_mask
+    else:
+        mid = (src + dst) // 2
+        tigers_bb ^= (1 << src) | (1 << dst)
+        goats_bb &= ~(1 << mid)
+        goats_eaten += 1
+    return tigers_bb, goats_bb, -turn, goats_to_place, goats_eaten
+
+
+@njit(cache=True)
+def perft_bb(tigers_bb, goats_bb, turn, goats_to_place, goats_eaten, depth,
+             moves_buf, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS):
+    # moves_buf: (depth, MAX_MOVES, 2), one move list per remaining depth
+    if depth == 0:
+        return 1
+    if goats_eaten >= 5:
+        return 0
+    if count_trapped_tigers(tigers_bb, goats_bb, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS) == 4:
+        return 0
+
+    moves = moves_buf[depth - 1]
+    n = generate_moves(tigers_bb, goats_bb, turn, goats_to_place, False,
+                       moves, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS)
+    if depth == 1:
+        # bulk counting: every child is a leaf
+        return n
+
+    nodes = 0
+    for i in range(n):
+        t, g, side, to_place, eaten = apply_move(tigers_bb, goats_bb, turn, goats_to_place, goats_eaten,
+                                                 moves[i, 0], moves[i, 1], MOVE_MASKS)
+        nodes += perft_bb(t, g, side, to_place, eaten, depth - 1,
+                          moves_buf, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS)
+    return nodes
+
+
+@njit(parallel=True, cache=True)
+def divide_bb_parallel(tigers_bb, goats_bb, turn, goats_to_place, goats_eaten, depth,
+                       MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS):
+    # the root moves are split across threads, each with its own move buffers
+    root_moves = np.empty((MAX_MOVES, 2), dtype=np.int64)
+    n = 0
+    if depth > 0 and goats_eaten < 5 and \
+            count_trapped_tigers(tigers_bb, goats_bb, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS) < 4:
+        n = generate_moves(tigers_bb, goats_bb, turn, goats_to_place, False,
+                           root_moves, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS)
+
+    counts = np.zeros(n, dtype=np.int64)
+    for i in prange(n):
+        moves_buf = np.empty((max(depth - 1, 1), MAX_MOVES, 2), dtype=np.int64)
+        t, g, side, to_place, eaten = apply_move(tigers_bb, goats_bb, turn, goats_to_place, goats_eaten,
+                                                 root_moves[i, 0], root_moves[i, 1], MOVE_MASKS)
+        counts[i] = perft_bb(t, g, side, to_place, eaten, depth - 1,
+                             moves_buf, MOVE_MASKS, CAPTURE_COUNTS, CAPTURE_MASKS)
+    return root_moves[:n].copy(), counts
+
+
+def perft_compiled(state: BitboardGameState, depth):
+    moves_buf = np.empty((max(depth, 1), MAX_MOVES, 2), dtype=np.int64)
+    return perft_bb(state.tigers_bb, state.goats_bb, state.turn, state.goats_to_place, state.goats_eaten,
+                    depth, moves_buf, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
+
+
+def divide_parallel(state: BitboardGameState, depth):
+    moves, counts = divide_bb_parallel(state.tigers_bb, state.goats_bb, state.turn, state.goats_to_place,
+                                       state.goats_eaten, depth, MOVE_MASKS_NP, CAPTURE_COUNTS, CAPTURE_MASKS_NP)
+    return {(src, dst): count for (src, dst), count in zip(moves.tolist(), counts.tolist())}
+
+
+def perft_parallel(state: BitboardGameState, depth):
+    if depth == 0:
+        return 1
+    return sum(divide_parallel(state, depth).values())
+
+
+PERFT_FUNCTIONS = {
+    "python": perft,
+    "compiled": perft_compiled,
+    "parallel": perft_parallel,
+    # the same recursion as the python perft, over a CompiledGameState
+    "state": perft_compiled_state,
+}
+
+
+def verify(kind="compiled", max_nodes=50_000_000):
+    """Checks the node counts of the given perft implementation against PERFT_REFERENCE and reports nodes/sec."""
+    perft_fn = PERFT_FUNCTIONS[kind]
+    ok = True
+    if kind == "state":
+        # matching node counts aren't enough, the state has to match BitboardGameState after every move
+        try:
+            print(f"[perft state] {check_equivalence(games=20)} positions match BitboardGameState")
+        except AssertionError as e:
+            print(f"[perft state] MISMATCH {e}")
+            ok = False
+    for name, reference in PERFT_REFERENCE.items():
+        for depth, expected in enumerate(reference, start=1):
+            if expected > max_nodes:
+                break
+            state = make_position(name)
+            start = time.perf_counter()
+            nodes = perft_fn(state, depth)
+            elapsed = time.perf_counter() - start
+            status = "ok" if nodes == expected else f"MISMATCH (expected {expected})"
+            ok &= nodes == expected
+            print(f"[perft {kind}] {name:<16} depth {depth}: {nodes:>12} nodes "
+                  f"{nodes / max(elapsed, 1e-9):>12.0f} nodes/s {status}")
+    return ok
+
+
+def scaling(name="start", depth=6):
+    """Time of the parallel perft for 1, 2, 4, ... threads."""
+    state = make_position(name)
+    perft_parallel(state, 2)  # compile before timing
+    threads = 1
+    while threads <= numba.config.NUMBA_NUM_THREADS:
+        numba.set_num_threads(threads)
+        start = time.perf_counter()
+        nodes = perft_parallel(state, depth)
+        elapsed = time.perf_counter() - start
+        print(f"[perft parallel] {threads:>2} threads: {nodes} nodes in {elapsed:.2f}s "
+              f"({nodes / elapsed:.0f} nodes/s)")
+        threads *= 2
+    numba.set_num_threads(numba.config.NUMBA_NUM_THREADS)
+
+
+def generate_reference(max_nodes=2_000_000):
+    """Prints PERFT_REFERENCE as computed by the python perft (the reference implementation)."""
+    print("PERFT_REFERENCE = {")
+    for name in BENCHMARK_POSITIONS:
+        counts = []
+        depth = 1
+        while not counts or counts[-1] * 8 < max_nodes:
+            counts.append(perft(make_position(name), depth))
+            if counts[-1] == 0:
+                break
+            depth += 1
+        print(f"    \"{name}\": {counts},")
+    print("}")
+
+
+if __name__ == "__main__":
+    # usage: python perft.py [python|compiled|parallel|state|scaling|reference]
+    kind = sys.argv[1] if len(sys.argv) > 1 else "compiled"
+    if kind == "reference":
+        generate_reference()
+    elif kind == "scaling":
+        scaling()
+    else:
+        # compile before timing
+        PERFT_FUNCTIONS[kind](BitboardGameState(), 2)
+        sys.exit(0 if verify(kind) else 1)
@@ -0,0 +1,94 @@
+import threading
+import time
+
+# Pondering
+# After the agent has moved, the opponent's most likely reply (the second move of the PV, or the
+# most visited reply in the MCTS tree) is played on a copy of the board and the agent searches
+# the resulting position in a background thread while the opponent thinks.
+#
+# ponder hit: the opponent played the expected reply. The ponder search simply goes on (same TT,
+#   same MCTS tree) until it has had time_limit seconds in total, so if the opponent took longer
+#   than that the move is ready right away.
+# ponder miss: the ponder search is stopped and the actual position is searched as usual.
+#
+# both agents check their stop_event together with the time limit.
+# the ponder search has no time limit of its own, so its memory has to be bounded elsewhere:
+# AlphaBetaAgent's TT and eval cache have a fixed size, MCTS stops at max_nodes tree nodes and keeps
+# its caches below CACHE_LIMIT during the search (see mcts.py).
+
+
+class Ponderer:
+    def __init__(self, agent):
+        self.agent = agent
+        self.thread = None
+        self.stop_event = threading.Event()
+        # the opponent's move we're pondering on and the position after it
+        self.expected_reply = None
+        self.ponder_key = None
+        self.ponder_start = 0.0
+        self.ponder_move = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, gs, game_history=None):
+        """
+        Starts pondering on gs, the position right after the agent's own move.
+        Returns False if the last search didn't leave an expected reply.
+        """
+        self.stop()
+        reply = self.agent.expected_reply()
+        if reply is None or gs.is_game_over or reply not in gs.get_legal_moves():
+            return False
+        state = gs.copy()
+        state.make_move(reply)
+        if state.is_game_over:
+            return False
+
+        self.expected_reply = reply
+        self.ponder_key = state.key
+        self.ponder_move = None
+        self.stop_event.clear()
+        self.ponder_start = time.time()
+        self.thread = threading.Thread(target=self._ponder, args=(state, game_history), daemon=True)
+        self.thread.start()
+        return True
+
+    def _ponder(self, state, game_history):
+        self.agent.stop_event = self.stop_event
+        try:
+            if hasattr(self.agent, "search"):
+                self.ponder_move = self.agent.search(state, time_limit=float('inf'), game_history=game_history)
+            else:
+                self.ponder_move = self.agent.get_best_move(state, game_history=game_history,
+                                                            time_limit=float('inf'))
+        finally:
+            self.agent.stop_event = None
+
+    def stop(self):
+        """Ends the ponder search (if any) and waits for it."""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def get_best_move(self, gs, game_history=None, time_limit=1.0):
+        """
+        The agent's move in gs, the position after the opponent's reply.
+        Takes the place of agent.get_best_move/ agent.search.
+        """
+        if self.thread is not None and gs.key == self.ponder_key:
+            self.hits += 1
+            remaining = self.ponder_start + time_limit - time.time()
+            print(f" > Ponder hit, {max(remaining, 0):.2f}s left to search.")
+            if remaining > 0:
+                self.thread.join(remaining)
+            self.stop()
+            return self.ponder_move
+
+        if self.thread is not None:
+            self.misses += 1
+            print(" > Ponder miss.")
+            self.stop()
+        if hasattr(self.agent, "search"):
+            return self.agent.search(gs, time_limit=time_limit, game_history=game_history)
+        return self.agent.get_best_move(gs, game_history=game_history, time_limit=time_limit)
@@ -0,0 +1,25 @@
+from bagchal import *
+
+
+# start position + the hand picked positions from main.py:scratch
+# name -> (tiger positions, goat positions, turn, goats_eaten)
+BENCHMARK_POSITIONS = {
+    "start": ([0, 4, 20, 24], [], Piece_GOAT, 0),
+    "late_placement": ([0, 9, 12, 24], [11], Piece_TIGER, 4),
+    "interesting_1": ([0, 11, 20, 24], [1, 2, 3, 4, 8, 9, 10, 15, 21, 22, 23], Piece_GOAT, 0),
+    "interesting_2": ([4, 20, 24, 17], [0, 1, 2, 3, 5, 6, 7, 8, 9, 10, 14, 15, 21, 22], Piece_GOAT, 0),
+    "interesting_3": ([0, 8, 20, 24], [1, 2, 3, 5, 10, 14, 15, 19, 21, 22], Piece_GOAT, 0),
+    "scratch": ([5, 8, 20, 24], [0, 1, 2, 3, 4, 9, 17], Piece_TIGER, 0),
+}
+
+
+def make_position(name):
+    pos_tiger, pos_goat, turn, goats_eaten = BENCHMARK_POSITIONS[name]
+    tigers_bb = 0
+    goats_bb = 0
+    for p in pos_tiger:
+        tigers_bb |= (1 << p)
+    for p in pos_goat:
+        goats_bb |= (1 << p)
+    goats_to_place = 20 - len(pos_goat) - goats_eaten
+    return BitboardGameState(tigers_bb, goats_bb, turn, goats_to_place, goats_eaten)
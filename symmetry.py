@@ -0,0 +1,133 @@
+from numba import njit
+import numpy as np
+from bagchal import (_graph, _capture_edges, compute_zobrist, PACKED_MOVE,
+                     ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN)
+
+# The board (and the _graph/ _capture_edges adjacency) is invariant under the
+# 8 symmetries of the square (the dihedral group D4). Symmetric positions have the
+# same evaluation and their best moves map onto each other, so caches can store one
+# canonical orientation per position instead of up to 8.
+#
+# position = row * 5 + col
+# sym -> (row, col) of the position after the transformation
+_transforms = (
+    lambda r, c: (r, c),            # 0: identity
+    lambda r, c: (c, 4 - r),        # 1: rotate 90
+    lambda r, c: (4 - r, 4 - c),    # 2: rotate 180
+    lambda r, c: (4 - c, r),        # 3: rotate 270
+    lambda r, c: (r, 4 - c),        # 4: mirror left-right
+    lambda r, c: (4 - r, c),        # 5: mirror top-bottom
+    lambda r, c: (c, r),            # 6: main diagonal
+    lambda r, c: (4 - c, 4 - r),    # 7: anti diagonal
+)
+NUM_SYMMETRIES = len(_transforms)
+
+# SYM_SQUARES[sym][pos] -> pos after applying sym
+SYM_SQUARES = []
+for transform in _transforms:
+    squares = []
+    for pos in range(25):
+        r, c = transform(*divmod(pos, 5))
+        squares.append(r * 5 + c)
+    SYM_SQUARES.append(squares)
+
+# SYM_INVERSE[sym] -> the symmetry that undoes sym
+SYM_INVERSE = []
+for sym in range(NUM_SYMMETRIES):
+    for inv in range(NUM_SYMMETRIES):
+        if all(SYM_SQUARES[inv][SYM_SQUARES[sym][pos]] == pos for pos in range(25)):
+            SYM_INVERSE.append(inv)
+            break
+
+# sanity check: the adjacency must map onto itself under every symmetry
+for squares in SYM_SQUARES:
+    for src, dsts in _graph.items():
+        assert sorted(squares[d] for d in dsts) == sorted(_graph[squares[src]])
+    for src, edges in _capture_edges.items():
+        assert (sorted((squares[m], squares[l]) for m, l in edges)
+                == sorted(_capture_edges[squares[src]]))
+
+# a bitboard is transformed one row (5 bits) at a time:
+# ROW_TABLES[sym, row, bits of the row] -> the transformed bits of that row
+ROW_TABLES = np.zeros((NUM_SYMMETRIES, 5, 32), dtype=np.int64)
+for sym in range(NUM_SYMMETRIES):
+    for row in range(5):
+        for bits in range(32):
+            mask = 0
+            for col in range(5):
+                if bits & (1 << col):
+                    mask |= 1 << SYM_SQUARES[sym][row * 5 + col]
+            ROW_TABLES[sym, row, bits] = mask
+
+
+@njit(cache=True)
+def transform_bb(bb: int, sym: int, ROW_TABLES) -> int:
+    out = 0
+    for row in range(5):
+        out |= ROW_TABLES[sym, row, (bb >> (5 * row)) & 31]
+    return out
+
+
+@njit(cache=True)
+def canonicalize(tigers_bb: int, goats_bb: int, ROW_TABLES):
+    """
+    Returns (sym, tigers_bb, goats_bb) of the canonical orientation of the position:
+    the one with the smallest (tigers_bb, goats_bb) among all 8 symmetric ones.
+    sym maps the given position onto the canonical one.
+    """
+    best_sym = 0
+    best_tigers = tigers_bb
+    best_goats = goats_bb
+    for sym in range(1, 8):
+        t = transform_bb(tigers_bb, sym, ROW_TABLES)
+        if t > best_tigers:
+            continue
+        g = transform_bb(goats_bb, sym, ROW_TABLES)
+        if t < best_tigers or g < best_goats:
+            best_sym = sym
+            best_tigers = t
+            best_goats = g
+    return best_sym, best_tigers, best_goats
+
+
+@njit(cache=True)
+def canonical_zobrist(tigers_bb: int, goats_bb: int, side: int, goats_eaten: int, goats_to_place: int, ROW_TABLES,
+                      ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN):
+    sym, tigers_bb, goats_bb = canonicalize(tigers_bb, goats_bb, ROW_TABLES)
+    key = compute_zobrist(tigers_bb, goats_bb, side, goats_eaten, goats_to_place,
+                          ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN)
+    return key, sym
+
+
+def canonical_key(state):
+    """
+    (key, sym) where key is the zobrist hash shared by all 8 symmetric versions of the
+    state and sym maps the state onto the canonical orientation.
+    Use transform_move(move, sym) to store a move under the canonical key and
+    transform_move(move, SYM_INVERSE[sym]) to map it back.
+    """
+    return canonical_zobrist(state.tigers_bb, state.goats_bb, state.turn,
+                             state.goats_eaten, state.goats_to_place, ROW_TABLES,
+                             ZOBRIST_PIECE, ZOBRIST_SIDE, ZOBRIST_TO_PLACE, ZOBRIST_EATEN)
+
+
+# SYM_MOVES[sym][(src, dst)] -> the move after applying sym
+# SYM_MOVES[sym][packed move] -> the packed move after applying sym
+# (a lookup is a lot cheaper than unpacking and rebuilding the tuple in the search loops)
+SYM_MOVES = []
+for squares in SYM_SQUARES:
+    table = {}
+    for src in range(25):
+        for dst in range(25):
+            table[(src, dst)] = (squares[src], squares[dst])
+            table[PACKED_MOVE[src * 25 + dst]] = PACKED_MOVE[squares[src] * 25 + squares[dst]]
+    SYM_MOVES.append(table)
+
+
+def transform_move(move, sym):
+    return SYM_MOVES[sym][move]
+
+
+def transform_moves(moves, sym):
+    table = SYM_MOVES[sym]
+    return [table[move] for move in moves]